@@ -0,0 +1,395 @@
+"""A fake ComfyUI server for load-testing the bot without a GPU.
+
+Implements the parts of the ComfyUI API the bot uses: /prompt, /ws,
+/history/{prompt_id}, /view, /upload/image, /queue (including deleting
+queued prompts), /interrupt, /system_stats and /object_info (for the
+nodes of the bundled workflows). SaveImageWebsocket nodes stream their
+images as binary frames like the real node does.
+Prompts run one at a time like on a real server (or several at once with
+--workers) and send the same WebSocket events ComfyUI does, including
+progress and binary preview frames.
+
+    python benchmarks/fake_comfyui.py --port 8188 --delay 2 --width 1024 --height 1024
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+from typing import Optional, Dict, Any, List
+
+from aiohttp import web, WSMsgType
+from PIL import Image
+
+logger = logging.getLogger('fake_comfyui')
+
+# Binary WebSocket frame type for preview images, followed by the image format (1 = JPEG, 2 = PNG)
+PREVIEW_IMAGE = 1
+JPEG = 1
+PNG = 2
+
+
+def _noise_png(width: int, height: int) -> bytes:
+    """Random pixels, so the PNG is about as large as a real render of that size."""
+    image = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def _object_info(checkpoints: List[str]) -> Dict[str, Any]:
+    """Input specs of the nodes the bundled workflows use, in ComfyUI's /object_info format."""
+    latent = ['INT', {'default': 512, 'min': 16, 'max': 16384, 'step': 8}]
+    batch = ['INT', {'default': 1, 'min': 1, 'max': 4096}]
+    return {
+        'CheckpointLoaderSimple': {'input': {'required': {'ckpt_name': [checkpoints]}}},
+        'KSampler': {'input': {'required': {
+            'model': ['MODEL'], 'positive': ['CONDITIONING'], 'negative': ['CONDITIONING'],
+            'latent_image': ['LATENT'],
+            'seed': ['INT', {'default': 0, 'min': 0, 'max': 0xffffffffffffffff}],
+            'steps': ['INT', {'default': 20, 'min': 1, 'max': 10000}],
+            'cfg': ['FLOAT', {'default': 8.0, 'min': 0.0, 'max': 100.0}],
+            'sampler_name': [['euler', 'euler_ancestral', 'heun', 'dpmpp_2m', 'dpmpp_sde', 'ddim', 'uni_pc']],
+            'scheduler': [['normal', 'karras', 'exponential', 'sgm_uniform', 'simple', 'ddim_uniform']],
+            'denoise': ['FLOAT', {'default': 1.0, 'min': 0.0, 'max': 1.0}]
+        }}},
+        'CLIPTextEncode': {'input': {'required': {'text': ['STRING', {'multiline': True}], 'clip': ['CLIP']}}},
+        'EmptyLatentImage': {'input': {'required': {'width': latent, 'height': latent, 'batch_size': batch}}},
+        'RepeatLatentBatch': {'input': {'required': {'samples': ['LATENT'], 'amount': batch}}},
+        # Like ComfyUI, a combo of the input files there were when /object_info was fetched
+        'LoadImage': {'input': {'required': {'image': [[], {'image_upload': True}]}}},
+        'VAEEncode': {'input': {'required': {'pixels': ['IMAGE'], 'vae': ['VAE']}}},
+        'VAEDecode': {'input': {'required': {'samples': ['LATENT'], 'vae': ['VAE']}}},
+        'SaveImage': {'input': {'required': {'images': ['IMAGE'], 'filename_prefix': ['STRING']}}},
+        'SaveImageWebsocket': {'input': {'required': {'images': ['IMAGE']}}}
+    }
+
+
+def _batch_size(workflow: Dict[str, Any]) -> int:
+    sizes = [
+        node.get('inputs', {}).get('batch_size') or node.get('inputs', {}).get('amount')
+        for node in workflow.values()
+        if node.get('class_type') in ('EmptyLatentImage', 'RepeatLatentBatch')
+    ]
+    return max([size for size in sizes if isinstance(size, int)] or [1])
+
+
+class FakeComfyUI:
+    """In-process fake server; use start()/close() or run it as a script."""
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 8188,
+        execution_delay: float = 1.0,
+        queue_delay: float = 0.0,
+        steps: int = 20,
+        width: int = 512,
+        height: int = 512,
+        previews: bool = True,
+        workers: int = 1,
+        checkpoints: Optional[List[str]] = None
+    ):
+        self.host = host
+        self.port = port
+        self.execution_delay = execution_delay
+        self.queue_delay = queue_delay
+        self.steps = steps
+        self.previews = previews
+        self.workers = workers
+        self.object_info = _object_info(checkpoints or ['sd_xl_base_1.0.safetensors'])
+        self.output_image = _noise_png(width, height)
+        self.output_frame = struct.pack('>II', PREVIEW_IMAGE, PNG) + self.output_image
+        self.preview_frame = struct.pack('>II', PREVIEW_IMAGE, JPEG) + self._preview_jpeg(width, height)
+
+        self._sockets: Dict[str, web.WebSocketResponse] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._send_lock: Optional[asyncio.Lock] = None
+        self._pending: List[Dict[str, Any]] = []
+        self._running: Dict[str, Dict[str, Any]] = {}
+        self._executions: Dict[str, asyncio.Task] = {}
+        self._history: Dict[str, Dict[str, Any]] = {}
+        self._uploads: Dict[str, bytes] = {}
+        self._number = 0
+        self._runner: Optional[web.AppRunner] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    @staticmethod
+    def _preview_jpeg(width: int, height: int) -> bytes:
+        image = Image.new('RGB', (max(1, width // 8), max(1, height // 8)), 'gray')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=80)
+        return buffer.getvalue()
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get('/ws', self._handle_ws)
+        app.router.add_post('/prompt', self._handle_prompt)
+        app.router.add_get('/history/{prompt_id}', self._handle_history)
+        app.router.add_get('/view', self._handle_view)
+        app.router.add_post('/upload/image', self._handle_upload)
+        app.router.add_get('/queue', self._handle_queue)
+        app.router.add_post('/queue', self._handle_queue_delete)
+        app.router.add_post('/interrupt', self._handle_interrupt)
+        app.router.add_get('/system_stats', self._handle_system_stats)
+        app.router.add_get('/object_info', self._handle_object_info)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _on_startup(self, app: web.Application):
+        self._queue = asyncio.Queue()
+        self._send_lock = asyncio.Lock()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _on_cleanup(self, app: web.Application):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        for ws in list(self._sockets.values()):
+            await ws.close()
+
+    async def _send(self, client_id: str, event_type: str, data: Dict[str, Any]):
+        async with self._send_lock:
+            await self._send_unlocked(client_id, event_type, data)
+
+    async def _send_unlocked(self, client_id: str, event_type: str, data: Dict[str, Any]):
+        ws = self._sockets.get(client_id)
+        if ws is not None and not ws.closed:
+            await ws.send_str(json.dumps({'type': event_type, 'data': data}))
+
+    async def _send_status(self, client_id: Optional[str] = None):
+        remaining = len(self._pending) + len(self._running)
+        data = {'status': {'exec_info': {'queue_remaining': remaining}}}
+        targets = [client_id] if client_id else list(self._sockets)
+        for target in targets:
+            await self._send(target, 'status', data)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job not in self._pending:
+                continue  # Deleted while queued
+            self._pending.remove(job)
+            prompt_id = job['prompt_id']
+            self._running[prompt_id] = job
+            execution = self._executions[prompt_id] = asyncio.create_task(self._execute(job))
+            try:
+                await execution
+            except asyncio.CancelledError:
+                if not job.get('interrupted'):
+                    raise
+                await self._send(job['client_id'], 'execution_interrupted', {'prompt_id': prompt_id, 'node_id': None})
+                self._history[prompt_id] = {
+                    'prompt': [job['number'], prompt_id, job['prompt'], {}, []],
+                    'outputs': {},
+                    'status': {'status_str': 'error', 'completed': False, 'messages': [['execution_interrupted', {}]]}
+                }
+            except Exception as e:
+                logger.error(f"Fake execution of {prompt_id} failed: {e}")
+            finally:
+                del self._running[prompt_id]
+                del self._executions[prompt_id]
+                await self._send_status()
+
+    async def _execute(self, job: Dict[str, Any]):
+        prompt_id = job['prompt_id']
+        client_id = job['client_id']
+        await self._send(client_id, 'execution_start', {'prompt_id': prompt_id, 'timestamp': int(time.time() * 1000)})
+        await self._send(client_id, 'execution_cached', {'prompt_id': prompt_id, 'nodes': []})
+
+        for node_id in job['prompt']:
+            await self._send(client_id, 'executing', {'node': node_id, 'display_node': node_id, 'prompt_id': prompt_id})
+            if job['prompt'][node_id].get('class_type') == 'KSampler':
+                steps = max(1, self.steps)
+                for step in range(1, steps + 1):
+                    await asyncio.sleep(self.execution_delay / steps)
+                    await self._send(client_id, 'progress', {'value': step, 'max': steps, 'prompt_id': prompt_id, 'node': node_id})
+                    ws = self._sockets.get(client_id)
+                    if self.previews and ws is not None and not ws.closed:
+                        await ws.send_bytes(self.preview_frame)
+            elif job['prompt'][node_id].get('class_type') == 'SaveImageWebsocket':
+                # Frames name no prompt, so with --workers > 1 nothing else may be sent in between
+                async with self._send_lock:
+                    await self._send_unlocked(client_id, 'executing', {'node': node_id, 'display_node': node_id, 'prompt_id': prompt_id})
+                    ws = self._sockets.get(client_id)
+                    for _ in range(job['batch_size']):
+                        if ws is not None and not ws.closed:
+                            await ws.send_bytes(self.output_frame)
+
+        output_node = next(
+            (node_id for node_id, node in job['prompt'].items() if node.get('class_type') == 'SaveImage'),
+            None
+        )
+        outputs = {}
+        if output_node is not None:
+            images = [
+                {'filename': f"fake_{prompt_id}_{idx:05}_.png", 'subfolder': '', 'type': 'output'}
+                for idx in range(job['batch_size'])
+            ]
+            outputs[output_node] = {'images': images}
+            await self._send(client_id, 'executed', {'node': output_node, 'output': {'images': images}, 'prompt_id': prompt_id})
+        # Same order as ComfyUI: execution_success comes from execute(), before the worker stores the history
+        await self._send(client_id, 'execution_success', {'prompt_id': prompt_id, 'timestamp': int(time.time() * 1000)})
+        self._history[prompt_id] = {
+            'prompt': [job['number'], prompt_id, job['prompt'], {}, list(outputs)],
+            'outputs': outputs,
+            'status': {'status_str': 'success', 'completed': True, 'messages': []}
+        }
+        await self._send(client_id, 'executing', {'node': None, 'prompt_id': prompt_id})
+
+    async def _handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client_id = request.query.get('clientId') or uuid.uuid4().hex
+        self._sockets[client_id] = ws
+        await self._send_status(client_id)
+        try:
+            async for message in ws:
+                if message.type == WSMsgType.ERROR:
+                    break
+        finally:
+            if self._sockets.get(client_id) is ws:
+                del self._sockets[client_id]
+        return ws
+
+    async def _handle_prompt(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+            workflow = body['prompt']
+        except (ValueError, KeyError):
+            return web.json_response({'error': {'type': 'invalid_prompt', 'message': 'Invalid prompt'}}, status=400)
+        if self.queue_delay:
+            await asyncio.sleep(self.queue_delay)
+
+        prompt_id = str(uuid.uuid4())
+        self._number += 1
+        job = {
+            'prompt_id': prompt_id,
+            'number': self._number,
+            'prompt': workflow,
+            'client_id': body.get('client_id', ''),
+            'batch_size': _batch_size(workflow)
+        }
+        self._pending.append(job)
+        self._queue.put_nowait(job)
+        await self._send_status()
+        return web.json_response({'prompt_id': prompt_id, 'number': job['number'], 'node_errors': {}})
+
+    async def _handle_history(self, request: web.Request) -> web.Response:
+        prompt_id = request.match_info['prompt_id']
+        entry = self._history.get(prompt_id)
+        return web.json_response({prompt_id: entry} if entry is not None else {})
+
+    async def _handle_view(self, request: web.Request) -> web.Response:
+        filename = request.query.get('filename', '')
+        if request.query.get('type') == 'input':
+            data = self._uploads.get(filename)
+            if data is None:
+                raise web.HTTPNotFound()
+            return web.Response(body=data, content_type='image/png')
+        return web.Response(body=self.output_image, content_type='image/png')
+
+    async def _handle_upload(self, request: web.Request) -> web.Response:
+        reader = await request.multipart()
+        name = None
+        async for part in reader:
+            if part.name == 'image':
+                name = part.filename or f"upload_{uuid.uuid4().hex}.png"
+                self._uploads[name] = await part.read()
+            else:
+                await part.read()
+        if name is None:
+            return web.Response(status=400, text='No image uploaded')
+        return web.json_response({'name': name, 'subfolder': '', 'type': 'input'})
+
+    async def _handle_queue(self, request: web.Request) -> web.Response:
+        def entry(job):
+            return [job['number'], job['prompt_id'], job['prompt'], {}, []]
+
+        return web.json_response({
+            'queue_running': [entry(job) for job in self._running.values()],
+            'queue_pending': [entry(job) for job in self._pending]
+        })
+
+    async def _handle_queue_delete(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if body.get('clear'):
+            self._pending.clear()
+        delete = set(body.get('delete', []))
+        self._pending = [job for job in self._pending if job['prompt_id'] not in delete]
+        await self._send_status()
+        return web.Response()
+
+    async def _handle_interrupt(self, request: web.Request) -> web.Response:
+        try:
+            prompt_id = (await request.json()).get('prompt_id')
+        except ValueError:
+            prompt_id = None
+        for running_id, execution in list(self._executions.items()):
+            if prompt_id is None or running_id == prompt_id:
+                self._running[running_id]['interrupted'] = True
+                execution.cancel()
+        return web.Response()
+
+    async def _handle_system_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'system': {'os': 'posix', 'python_version': 'fake', 'comfyui_version': 'fake'},
+            'devices': [{
+                'name': 'fake', 'type': 'cuda', 'index': 0,
+                'vram_total': 24 * 1024 ** 3, 'vram_free': 20 * 1024 ** 3
+            }]
+        })
+
+    async def _handle_object_info(self, request: web.Request) -> web.Response:
+        load_image = {'input': {'required': {'image': [sorted(self._uploads), {'image_upload': True}]}}}
+        return web.json_response(dict(self.object_info, LoadImage=load_image))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8188)
+    parser.add_argument('--delay', type=float, default=1.0, help='seconds of sampling per prompt')
+    parser.add_argument('--queue-delay', type=float, default=0.0, help='seconds /prompt takes to answer')
+    parser.add_argument('--steps', type=int, default=20, help='progress events per prompt')
+    parser.add_argument('--width', type=int, default=512, help='output image width')
+    parser.add_argument('--height', type=int, default=512, help='output image height')
+    parser.add_argument('--no-previews', action='store_true', help='do not send preview frames')
+    parser.add_argument('--workers', type=int, default=1, help='prompts executed at the same time')
+    parser.add_argument('--checkpoints', default='sd_xl_base_1.0.safetensors', help='comma-separated checkpoint names')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = FakeComfyUI(
+        host=args.host,
+        port=args.port,
+        execution_delay=args.delay,
+        queue_delay=args.queue_delay,
+        steps=args.steps,
+        width=args.width,
+        height=args.height,
+        previews=not args.no_previews,
+        workers=args.workers,
+        checkpoints=[name.strip() for name in args.checkpoints.split(',') if name.strip()]
+    )
+    logger.info(f"Fake ComfyUI listening on http://{args.host}:{args.port}")
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
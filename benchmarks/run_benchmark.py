@@ -0,0 +1,243 @@
+"""Load-test ComfyUIClient with simulated /generate jobs.
+
+Starts a fake ComfyUI server in a separate process (or uses --url), then
+runs N jobs with at most C in flight. Each job follows the bot's path
+through the client: optional input upload, render the workflow template,
+queue it, wait for completion while consuming progress and preview
+events, and download the outputs (or receive them over the WebSocket
+with --websocket-output). Reports throughput, p50/p99 latency, peak
+memory and peak open sockets.
+
+    python benchmarks/run_benchmark.py --jobs 200 --concurrency 50 --delay 0.2
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Optional, Dict, Any, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiohttp  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from comfyui_client import ComfyUIClient  # noqa: E402
+from workflow_templates import WorkflowTemplateRegistry  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _open_sockets() -> Optional[int]:
+    """Sockets open in this process, or None where /proc is unavailable."""
+    try:
+        names = os.listdir('/proc/self/fd')
+    except OSError:
+        return None
+    count = 0
+    for name in names:
+        try:
+            if os.readlink(f'/proc/self/fd/{name}').startswith('socket:'):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _input_image() -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (512, 512), 'gray').save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+
+async def _wait_for_server(url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f'{url}/system_stats') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Fake ComfyUI at {url} did not start")
+            await asyncio.sleep(0.1)
+
+
+async def run_job(
+    client: ComfyUIClient,
+    templates: WorkflowTemplateRegistry,
+    args: argparse.Namespace,
+    input_image: bytes
+) -> int:
+    """One simulated /generate job; returns the number of output bytes received."""
+    params = {
+        'prompt': 'a benchmark', 'negative_prompt': '', 'steps': 20, 'cfg': 7.0,
+        'sampler_name': 'euler', 'scheduler': 'normal', 'checkpoint': 'fake.safetensors',
+        'seed': random.randrange(2**32), 'batch_size': args.batch
+    }
+    if args.img2img:
+        # Vary the bytes so content-hash deduplication doesn't skip the upload
+        data = input_image + os.urandom(16)
+        params.update(denoise=0.75, image=await client.upload_image(data, 'input.jpg'))
+        template = templates.get('img2img')
+    else:
+        params.update(denoise=1.0, width=args.width, height=args.height)
+        template = templates.get('text2img')
+    if args.websocket_output:
+        template = template.websocket_output()
+    workflow = template.render(**params)
+
+    events = 0
+
+    def on_event(event_type: str, data: Dict[str, Any]):
+        nonlocal events
+        events += 1
+
+    prompt_id = await client.queue_prompt(workflow)
+    if args.websocket_output:
+        images = await client.wait_for_images(prompt_id, template.output_nodes, on_event=on_event)
+    else:
+        history = await client.wait_for_completion(prompt_id, on_event=on_event)
+        images = await client.get_output_images(history)
+    size = 0
+    for image in images:
+        size += image.seek(0, io.SEEK_END)
+        image.close()
+    return size
+
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    templates = WorkflowTemplateRegistry(os.path.join(ROOT, 'workflows'))
+    templates.load()
+    client = ComfyUIClient(
+        args.url,
+        pool_size=args.pool_size,
+        download_concurrency=args.download_concurrency
+    )
+    await client.start()
+    await client.events.wait_connected(timeout=10)
+    input_image = _input_image()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    failures = 0
+    received = 0
+    peak_sockets = _open_sockets() or 0
+
+    async def sample_sockets():
+        nonlocal peak_sockets
+        while True:
+            peak_sockets = max(peak_sockets, _open_sockets() or 0)
+            await asyncio.sleep(0.05)
+
+    async def timed_job():
+        nonlocal failures, received
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                received += await run_job(client, templates, args, input_image)
+            except Exception as e:
+                failures += 1
+                print(f"job failed: {e!r}", file=sys.stderr)
+                return
+            latencies.append(time.perf_counter() - started)
+
+    sampler = asyncio.create_task(sample_sockets())
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(timed_job() for _ in range(args.jobs)))
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        await client.close()
+
+    return {
+        'jobs': args.jobs,
+        'concurrency': args.concurrency,
+        'failures': failures,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_jobs_s': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_p50_s': round(_percentile(latencies, 0.50), 4),
+        'latency_p99_s': round(_percentile(latencies, 0.99), 4),
+        'received_mb': round(received / (1024 * 1024), 1),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'peak_open_sockets': peak_sockets if _open_sockets() is not None else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--jobs', type=int, default=100, help='number of simulated /generate jobs')
+    parser.add_argument('--concurrency', type=int, default=20, help='jobs in flight at once')
+    parser.add_argument('--url', help='use a running (fake) ComfyUI server instead of starting one')
+    parser.add_argument('--delay', type=float, default=0.2, help='fake sampling seconds per prompt')
+    parser.add_argument('--steps', type=int, default=20, help='fake progress events per prompt')
+    parser.add_argument('--workers', type=int, default=4, help='prompts the fake server runs at once')
+    parser.add_argument('--width', type=int, default=512)
+    parser.add_argument('--height', type=int, default=512)
+    parser.add_argument('--batch', type=int, default=1, help='images per prompt')
+    parser.add_argument('--img2img', action='store_true', help='upload an input image for every job')
+    parser.add_argument('--no-previews', action='store_true', help='fake server sends no preview frames')
+    parser.add_argument('--websocket-output', action='store_true', help='receive outputs over the WebSocket instead of /view')
+    parser.add_argument('--pool-size', type=int, default=100, help='ComfyUIClient connection pool size')
+    parser.add_argument('--download-concurrency', type=int, default=4)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    server = None
+    if args.url is None:
+        # A separate process, so the server's work doesn't skew the client's numbers
+        port = _free_port()
+        args.url = f'http://127.0.0.1:{port}'
+        command = [
+            sys.executable, os.path.join(ROOT, 'benchmarks', 'fake_comfyui.py'),
+            '--port', str(port), '--delay', str(args.delay), '--steps', str(args.steps),
+            '--workers', str(args.workers), '--width', str(args.width), '--height', str(args.height)
+        ]
+        if args.no_previews:
+            command.append('--no-previews')
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        asyncio.run(_wait_for_server(args.url))
+        results = asyncio.run(benchmark(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for key, value in results.items():
+            print(f"{key:<20} {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,35 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import io
 import logging
 import asyncio
-from typing import Optional
+import hashlib
+import json
+import math
+import os
+import random
+import signal
+import sqlite3
+import time
+import uuid
+from typing import Optional, BinaryIO
 
-from comfyui_client import ComfyUIClient
+import aiohttp
+
+from comfyui_client import input_image_name
+from comfyui_pool import ComfyUIBackendPool, CHECKPOINT_LOADER
+from image_processing import ImageProcessor, DEFAULT_UPLOAD_LIMIT
+from job_journal import JobJournal, QUEUED
+from job_relay import Dispatcher, InteractionRelay, RemoteInteraction
+from job_scheduler import JobScheduler, QueueFullError
+from metrics import MetricsServer
+import metrics
+from node_catalog import WorkflowValidationError
+from progress_reporter import ProgressReporter
+from rate_limiter import RateLimiter, RateLimitError, job_cost
+from result_cache import ResultCache
+from shared_queue import SharedQueue
+from workflow_templates import WorkflowTemplate, WorkflowTemplateRegistry
 import config
 
 # Setup logging
@@ -16,23 +39,195 @@ logging.basicConfig(
 )
 logger = logging.getLogger('discord_bot')
 
+# Initialize ComfyUI backend pool
+comfy_pool = ComfyUIBackendPool(
+    config.COMFYUI_URLS,
+    poll_interval=config.COMFYUI_POLL_INTERVAL,
+    max_failures=config.COMFYUI_MAX_FAILURES,
+    model_swap_cost=config.COMFYUI_MODEL_SWAP_COST,
+    pool_size=config.COMFYUI_POOL_SIZE,
+    pool_size_per_host=config.COMFYUI_POOL_SIZE_PER_HOST,
+    keepalive_timeout=config.COMFYUI_KEEPALIVE_TIMEOUT,
+    download_concurrency=config.OUTPUT_DOWNLOAD_CONCURRENCY,
+    spool_threshold=int(config.OUTPUT_SPOOL_THRESHOLD_MB * 1024 * 1024),
+    object_info_ttl=config.COMFYUI_OBJECT_INFO_TTL
+)
+
+# Fair bot-side queue in front of the GPUs
+gpu_scheduler = JobScheduler(
+    max_concurrent=config.SCHEDULER_MAX_CONCURRENT,
+    max_queue_depth=config.SCHEDULER_MAX_QUEUE_DEPTH,
+    max_user_jobs=config.SCHEDULER_MAX_USER_JOBS,
+    max_guild_jobs=config.SCHEDULER_MAX_GUILD_JOBS,
+    loaded_models=comfy_pool.loaded_models,
+    max_model_skips=config.SCHEDULER_MAX_MODEL_SKIPS
+)
+
+# GPU budgets per user and per server, charged with each job's estimated cost
+rate_limiter = RateLimiter(
+    user_rate=config.RATE_LIMIT_USER_PER_MINUTE / 60,
+    user_burst=config.RATE_LIMIT_USER_BURST,
+    guild_rate=config.RATE_LIMIT_GUILD_PER_MINUTE / 60,
+    guild_burst=config.RATE_LIMIT_GUILD_BURST
+)
+
+# Cache of results for fixed-seed requests
+result_cache = ResultCache(
+    config.RESULT_CACHE_DIR,
+    memory_limit=config.RESULT_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_limit=config.RESULT_CACHE_DISK_MB * 1024 * 1024
+) if config.RESULT_CACHE_ENABLED else None
+
+# Jobs that haven't finished, so they can be resumed after a restart. Only in standalone mode:
+# a dispatcher's interrupted jobs are just reported as failed from the shared queue, not resumed.
+job_journal = JobJournal(config.JOB_JOURNAL_PATH) if config.JOB_JOURNAL_ENABLED and config.BOT_MODE == 'standalone' else None
+
+# Queue between the Discord frontends and the dispatcher when they run as separate processes
+shared_queue = SharedQueue(config.SHARED_QUEUE_PATH) if config.BOT_MODE != 'standalone' else None
+
+# Posts what the dispatcher sends back for this frontend's jobs
+interaction_relay = InteractionRelay(
+    shared_queue, config.FRONTEND_ID, poll_interval=config.SHARED_QUEUE_POLL_INTERVAL
+) if config.BOT_MODE == 'frontend' else None
+
+# Process pool for preparing input images and re-encoding outputs for Discord
+image_processor = ImageProcessor(
+    output_format=config.OUTPUT_FORMAT,
+    output_quality=config.OUTPUT_QUALITY,
+    grid=config.OUTPUT_GRID,
+    input_max_pixels=config.INPUT_MAX_PIXELS,
+    input_format=config.INPUT_FORMAT,
+    input_quality=config.INPUT_QUALITY,
+    workers=config.IMAGE_WORKERS
+)
+
+# ComfyUI workflows loaded from JSON files
+workflow_templates = WorkflowTemplateRegistry(config.WORKFLOWS_DIR, reload_interval=config.WORKFLOWS_RELOAD_INTERVAL)
+
+# Suggestions used until the servers' node catalogs have been fetched
+FALLBACK_SAMPLERS = [
+    "euler", "euler_ancestral", "heun", "dpm_2", "dpm_2_ancestral", "lms", "dpm_fast",
+    "dpm_adaptive", "dpmpp_2s_ancestral", "dpmpp_sde", "dpmpp_2m", "ddim", "uni_pc"
+]
+FALLBACK_SCHEDULERS = ["normal", "karras", "exponential", "sgm_uniform", "simple", "ddim_uniform"]
+
+# Backend label for jobs answered from the result cache without a ComfyUI server
+CACHE_BACKEND = 'cache'
+
+# Combo inputs the dispatcher shares with the frontends for autocomplete
+CATALOG_INPUTS = [('KSampler', 'sampler_name'), ('KSampler', 'scheduler'), (CHECKPOINT_LOADER, 'ckpt_name')]
+
+# Local Prometheus endpoint for per-stage latencies and job counts; frontends run no jobs to measure
+metrics_server = MetricsServer(
+    config.METRICS_HOST, config.METRICS_PORT
+) if config.METRICS_PORT and config.BOT_MODE != 'frontend' else None
+
+
+class ComfyBot(commands.AutoShardedBot):
+    """Bot that ties the ComfyUI backend pool lifecycle to its own.
+
+    Frontends have no ComfyUI connections; they start the shared queue
+    and the relay for the dispatcher's results instead.
+    """
+
+    # Set while closing; running jobs are then left in the journal instead of failing
+    shutting_down = False
+    _warm_up_task: Optional[asyncio.Task] = None
+
+    async def login(self, token: str):
+        # Connect to ComfyUI while Discord logs in and the gateway connects, not after
+        if interaction_relay is None:
+            self._warm_up_task = asyncio.create_task(self.warm_up())
+        await super().login(token)
+
+    async def warm_up(self):
+        """Open the ComfyUI connections, fetch the node catalogs and start the image workers."""
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(
+                comfy_pool.warm_up(config.COMFYUI_WARM_UP_TIMEOUT),
+                image_processor.warm_up()
+            )
+        except Exception as e:
+            logger.error(f"ComfyUI warm-up failed: {e}", exc_info=True)
+            return
+        logger.info(f"ComfyUI warm-up finished in {time.perf_counter() - started:.2f}s")
+
+    async def setup_hook(self):
+        await workflow_templates.start()
+        if result_cache is not None and interaction_relay is None:
+            await result_cache.start()
+        if interaction_relay is not None:
+            await shared_queue.start()
+            interaction_relay.start()
+        if metrics_server is not None:
+            await metrics_server.start()
+        if job_journal is not None:
+            await job_journal.start()
+            self._resume_task = asyncio.create_task(resume_journaled_jobs())
+        self._sync_task = asyncio.create_task(sync_commands())
+
+    async def close(self):
+        self.shutting_down = True
+        if self._warm_up_task is not None and not self._warm_up_task.done():
+            self._warm_up_task.cancel()
+        if metrics_server is not None:
+            await metrics_server.close()
+        await workflow_templates.close()
+        await comfy_pool.close()
+        image_processor.close()
+        if job_journal is not None:
+            await job_journal.close()
+        if interaction_relay is not None:
+            await interaction_relay.close()
+            await shared_queue.close()
+        await super().close()
+
+
 # Setup bot
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = ComfyBot(command_prefix='!', intents=intents, shard_count=config.SHARD_COUNT, shard_ids=config.SHARD_IDS)
 
-# Initialize ComfyUI client
-comfy_client = ComfyUIClient(config.COMFYUI_URL)
 
+async def sync_commands():
+    """Sync the slash commands with Discord, but only if they changed since the last sync.
+
+    Syncing is slow and rate limited, so a hash of the command payloads is
+    kept in COMMAND_TREE_HASH_PATH. Delete the file to force a sync.
+    """
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    digest = hashlib.sha256(
+        json.dumps([bot.application_id, payload], sort_keys=True).encode()
+    ).hexdigest()
+    try:
+        with open(config.COMMAND_TREE_HASH_PATH, encoding='utf-8') as f:
+            if f.read().strip() == digest:
+                logger.info('Commands unchanged since the last sync, skipping it')
+                return
+    except OSError:
+        pass
 
-@bot.event
-async def on_ready():
-    logger.info(f'Logged in as {bot.user} (ID: {bot.user.id})')
     try:
         synced = await bot.tree.sync()
-        logger.info(f'Synced {len(synced)} command(s)')
     except Exception as e:
         logger.error(f'Failed to sync commands: {e}')
+        return
+    logger.info(f'Synced {len(synced)} command(s)')
+
+    try:
+        directory = os.path.dirname(config.COMMAND_TREE_HASH_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(config.COMMAND_TREE_HASH_PATH, 'w', encoding='utf-8') as f:
+            f.write(digest)
+    except OSError as e:
+        logger.warning(f'Failed to store the command tree hash: {e}')
+
+
+@bot.event
+async def on_ready():
+    logger.info(f'Logged in as {bot.user} (ID: {bot.user.id}) with shard(s) {sorted(bot.shards)} of {bot.shard_count}')
 
 
 @bot.tree.command(name="generate", description="Generate an image using ComfyUI")
@@ -47,44 +242,25 @@ async def on_ready():
     denoise="Denoising strength for img2img (default: 0.75, 1.0 for txt2img)",
     width="Image width (default: 512, only for text2img)",
     height="Image height (default: 512, only for text2img)",
-    seed="Random seed for reproducibility (optional)"
+    seed="Random seed for reproducibility (optional)",
+    count="Number of images to generate in one batch (default: 1)",
+    checkpoint="Checkpoint model to generate with"
 )
-@app_commands.choices(sampler=[
-    app_commands.Choice(name="euler", value="euler"),
-    app_commands.Choice(name="euler_ancestral", value="euler_ancestral"),
-    app_commands.Choice(name="heun", value="heun"),
-    app_commands.Choice(name="dpm_2", value="dpm_2"),
-    app_commands.Choice(name="dpm_2_ancestral", value="dpm_2_ancestral"),
-    app_commands.Choice(name="lms", value="lms"),
-    app_commands.Choice(name="dpm_fast", value="dpm_fast"),
-    app_commands.Choice(name="dpm_adaptive", value="dpm_adaptive"),
-    app_commands.Choice(name="dpmpp_2s_ancestral", value="dpmpp_2s_ancestral"),
-    app_commands.Choice(name="dpmpp_sde", value="dpmpp_sde"),
-    app_commands.Choice(name="dpmpp_2m", value="dpmpp_2m"),
-    app_commands.Choice(name="ddim", value="ddim"),
-    app_commands.Choice(name="uni_pc", value="uni_pc"),
-])
-@app_commands.choices(scheduler=[
-    app_commands.Choice(name="normal", value="normal"),
-    app_commands.Choice(name="karras", value="karras"),
-    app_commands.Choice(name="exponential", value="exponential"),
-    app_commands.Choice(name="sgm_uniform", value="sgm_uniform"),
-    app_commands.Choice(name="simple", value="simple"),
-    app_commands.Choice(name="ddim_uniform", value="ddim_uniform"),
-])
 async def generate(
     interaction: discord.Interaction,
     prompt: str,
     negative_prompt: Optional[str] = "",
     image: Optional[discord.Attachment] = None,
-    steps: Optional[int] = None,
+    steps: Optional[app_commands.Range[int, 1, 150]] = None,
     cfg: Optional[float] = None,
     sampler: Optional[str] = None,
     scheduler: Optional[str] = None,
     denoise: Optional[float] = None,
-    width: Optional[int] = None,
-    height: Optional[int] = None,
-    seed: Optional[int] = None
+    width: Optional[app_commands.Range[int, 16, 16384]] = None,
+    height: Optional[app_commands.Range[int, 16, 16384]] = None,
+    seed: Optional[int] = None,
+    count: Optional[app_commands.Range[int, 1, config.BATCH_MAX_COUNT]] = None,
+    checkpoint: Optional[str] = None
 ):
     """Generate an image using ComfyUI."""
 
@@ -96,110 +272,614 @@ async def generate(
         )
         return
 
+    # Reject early if the queue is full, before anything is shown publicly
+    user_id = interaction.user.id
+    guild_id = interaction.guild_id or user_id
+    try:
+        await check_admission(user_id, guild_id)
+    except QueueFullError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
+
+    # Check the options against the servers' node catalog instead of finding out after queueing
+    requested = {
+        'steps': steps, 'cfg': cfg, 'sampler_name': sampler, 'scheduler': scheduler, 'denoise': denoise,
+        'width': width, 'height': height, 'seed': seed, 'checkpoint': checkpoint
+    }
+    try:
+        comfy_pool.validate(
+            workflow_template('img2img' if image is not None else 'text2img'),
+            {name: value for name, value in requested.items() if value is not None}
+        )
+    except WorkflowValidationError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
+
+    # Charge the job's GPU cost before anything is uploaded or queued
+    if image is not None:
+        # Inputs are scaled down to INPUT_MAX_PIXELS before they reach ComfyUI
+        pixels = min(image.width * image.height, config.INPUT_MAX_PIXELS) if image.width and image.height else config.INPUT_MAX_PIXELS
+    else:
+        pixels = (width or 512) * (height or 512)
+    cost = job_cost(steps or config.DEFAULT_KSAMPLER['steps'], pixels, count or 1)
+    try:
+        rate_limiter.charge(user_id, guild_id, cost)
+    except RateLimitError as e:
+        message = f"❌ {e}"
+        if e.retry_after is not None:
+            message += f" Try again <t:{math.ceil(time.time() + e.retry_after)}:R>."
+        await interaction.response.send_message(message, ephemeral=True)
+        return
+
     # Defer response since generation takes time
     await interaction.response.defer()
 
+    job_id = uuid.uuid4().hex
+    params = {
+        'prompt': prompt, 'negative_prompt': negative_prompt, 'steps': steps, 'cfg': cfg,
+        'sampler': sampler, 'scheduler': scheduler, 'denoise': denoise, 'width': width,
+        'height': height, 'seed': seed, 'count': count, 'checkpoint': checkpoint
+    }
+
+    if interaction_relay is not None:
+        # The dispatcher runs it; its messages come back to this process, which owns the interaction
+        interaction_relay.register(job_id, interaction, on_reject=lambda: rate_limiter.refund(user_id, guild_id, cost))
+        try:
+            await shared_queue.submit(
+                job_id, config.FRONTEND_ID, user_id, interaction.user.display_name, guild_id,
+                interaction.guild.filesize_limit if interaction.guild else None,
+                dict(params, attachment={'url': image.url, 'filename': image.filename} if image is not None else None)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Failed to queue job {job_id}: {e}")
+            interaction_relay.unregister(job_id)
+            rate_limiter.refund(user_id, guild_id, cost)
+            await interaction.followup.send("❌ The job queue is unavailable, please try again later.")
+        return
+
+    if job_journal is not None:
+        await job_journal.add(
+            job_id, user_id, interaction.guild_id, interaction.channel_id, dict(params, img2img=image is not None)
+        )
+
+    try:
+        await schedule_generation(interaction, job_id, user_id, guild_id, params, image)
+    except QueueFullError as e:
+        rate_limiter.refund(user_id, guild_id, cost)
+        await interaction.followup.send(f"❌ {e}")
+    finally:
+        if job_journal is not None and not bot.shutting_down:
+            await job_journal.finish(job_id)
+
+
+async def check_admission(user_id: int, guild_id: int):
+    """Raise QueueFullError if the scheduler that would run a new job from this user won't take it.
+
+    A frontend's own scheduler never gets jobs, so it applies the same
+    limits to the jobs in the shared queue and the dispatcher's last
+    published running count.
+    """
+    if interaction_relay is None:
+        gpu_scheduler.check_admission(user_id, guild_id)
+        return
+    try:
+        total, user_jobs, guild_jobs = await shared_queue.counts(user_id, guild_id)
+        running = (await shared_queue.state()).get('queue', [0, 0])[0]
+    except sqlite3.Error as e:
+        logger.warning(f"Shared queue unavailable for admission check: {e}")
+        return  # Queueing the job will fail and say so
+    gpu_scheduler.check_counts(max(total - running, 0), user_jobs, guild_jobs)
+
+
+async def schedule_generation(
+    interaction: discord.Interaction,
+    job_id: str,
+    user_id: int,
+    guild_id: int,
+    params: dict,
+    image: Optional[discord.Attachment]
+):
+    """Queue a job on the GPU scheduler and wait for it, keeping the user posted on its position.
+
+    The input image is read and preprocessed first, so the job's result
+    cache keys are known up front: a fixed-seed job whose results are all
+    cached is answered right away, without a GPU slot or a ComfyUI server.
+
+    Raises QueueFullError if the scheduler won't take the job.
+    """
+    try:
+        input_image = await read_input_image(image) if image is not None else None
+        plan = plan_generation(params, input_image)
+    except Exception as e:
+        logger.error(f"Error preparing generation: {e}", exc_info=True)
+        await interaction.followup.send(f"❌ Error generating image: {str(e)}")
+        return
+    if await send_cached_results(interaction, plan):
+        return
+
+    queued = False
+
+    async def report_position(position: int, total: int):
+        nonlocal queued
+        queued = True
+        await interaction.edit_original_response(content=f"⏳ Queued: position {position} of {total}")
+
+    async def run():
+        if queued:
+            await interaction.edit_original_response(content="🚀 Your job has started!")
+        await run_generation(interaction, job_id, plan, input_image)
+
+    job = gpu_scheduler.submit(
+        user_id, guild_id, run, on_position=report_position,
+        model=plan['settings']['checkpoint']
+    )
+    try:
+        await job
+    except asyncio.CancelledError:
+        if bot.shutting_down:
+            raise
+        # The job was cancelled with /cancel; this handler itself keeps running
+        await interaction.followup.send("🛑 Generation cancelled.")
+
+
+async def run_queued_job(interaction: RemoteInteraction, job: dict):
+    """Run a job from the shared queue; this is the dispatcher's side of /generate."""
+    params = dict(job['params'])
+    del params['attachment']
+    try:
+        await schedule_generation(interaction, job['job_id'], job['user_id'], job['guild_id'], params, interaction.attachment)
+    except QueueFullError as e:
+        # Jobs from other frontends got in between the frontend's admission check and this one
+        await interaction.reject(f"❌ {e}")
+
+
+def workflow_template(name: str) -> WorkflowTemplate:
+    """The named template, with WebSocket outputs when OUTPUT_WEBSOCKET is set."""
+    template = workflow_templates.get(name)
+    return template.websocket_output() if config.OUTPUT_WEBSOCKET else template
+
+
+def autocomplete_choices(values: list[str], current: str) -> list[app_commands.Choice[str]]:
+    """Up to 25 values matching what the user typed so far, prefix matches first."""
+    current = current.lower()
+    matches = [value for value in values if current in value.lower()]
+    matches.sort(key=lambda value: not value.lower().startswith(current))
+    return [app_commands.Choice(name=value[:100], value=value) for value in matches[:25] if len(value) <= 100]
+
+
+async def catalog_options(class_type: str, input_name: str) -> list[str]:
+    """A combo input's values on the servers; frontends use the ones the dispatcher last published."""
+    if shared_queue is None:
+        return comfy_pool.options(class_type, input_name)
+    try:
+        return (await shared_queue.state()).get(f'options:{class_type}.{input_name}', [])
+    except sqlite3.Error:
+        return []
+
+
+@generate.autocomplete('sampler')
+async def sampler_autocomplete(interaction: discord.Interaction, current: str):
+    return autocomplete_choices(await catalog_options('KSampler', 'sampler_name') or FALLBACK_SAMPLERS, current)
+
+
+@generate.autocomplete('scheduler')
+async def scheduler_autocomplete(interaction: discord.Interaction, current: str):
+    return autocomplete_choices(await catalog_options('KSampler', 'scheduler') or FALLBACK_SCHEDULERS, current)
+
+
+@generate.autocomplete('checkpoint')
+async def checkpoint_autocomplete(interaction: discord.Interaction, current: str):
+    return autocomplete_choices(await catalog_options(CHECKPOINT_LOADER, 'ckpt_name') or config.CHECKPOINTS, current)
+
+
+async def read_input_image(image: discord.Attachment) -> tuple[bytes, str, str]:
+    """Download and preprocess an img2img input: (data, filename, name it is uploaded to ComfyUI under)."""
+    with metrics.stage('attachment_read'):
+        image_data = await image.read()
+
+    # Validate, strip and downscale off the event loop before it costs GPU time
+    with metrics.stage('preprocess'):
+        image_data, image_filename = await image_processor.prepare_input(image_data, image.filename)
+    return image_data, image_filename, await input_image_name(image_data, image_filename)
+
+
+def plan_generation(params: dict, input_image: Optional[tuple[bytes, str, str]]) -> dict:
+    """Fill in a job's defaults and split it into GPU batches, each with its result cache key.
+
+    Keys are only set when the seed is fixed, since only then is the workflow deterministic.
+    """
+    is_img2img = input_image is not None
+
+    # Use default values from config if not provided
+    settings = dict(
+        params,
+        steps=params['steps'] or config.DEFAULT_KSAMPLER['steps'],
+        cfg=params['cfg'] or config.DEFAULT_KSAMPLER['cfg'],
+        sampler=params['sampler'] or config.DEFAULT_KSAMPLER['sampler_name'],
+        scheduler=params['scheduler'] or config.DEFAULT_KSAMPLER['scheduler'],
+        denoise=params['denoise'] or (0.75 if is_img2img else 1.0),
+        width=params['width'] or 512,
+        height=params['height'] or 512,
+        count=params['count'] or 1,
+        checkpoint=params['checkpoint'] or config.DEFAULT_CHECKPOINT,
+        img2img=is_img2img
+    )
+
+    if is_img2img:
+        template_name = 'img2img'
+        template_params = {'image': input_image[2]}
+    else:
+        template_name = 'text2img'
+        template_params = {'width': settings['width'], 'height': settings['height']}
+    template_params.update(
+        prompt=settings['prompt'],
+        negative_prompt=settings['negative_prompt'] or "",
+        steps=settings['steps'],
+        cfg=settings['cfg'],
+        sampler_name=settings['sampler'],
+        scheduler=settings['scheduler'],
+        denoise=settings['denoise'],
+        checkpoint=settings['checkpoint']
+    )
+
+    # Large batches are split into chunks that fit in VRAM; each chunk runs as one GPU batch
+    count = settings['count']
+    pixels = config.INPUT_MAX_PIXELS if is_img2img else settings['width'] * settings['height']
+    chunk_size = max(1, min(count, config.BATCH_MAX_PIXELS // pixels))
+
+    # A random seed is used when none was given; each chunk gets its own.
+    # ComfyUI takes seeds up to 2**64 - 1, so the first chunk keeps the given seed as is.
+    seed = settings['seed']
+    base_seed = seed if seed is not None else random.randrange(2**32)
+    chunks = [
+        ((base_seed + start) % 2**64, min(chunk_size, count - start))
+        for start in range(0, count, chunk_size)
+    ]
+
+    template = workflow_template(template_name)
+    keys = None
+    if seed is not None and result_cache is not None:
+        # A fixed seed makes the workflow deterministic, so identical requests can share results.
+        # Input images are named by content hash, so img2img keys cover the image too.
+        keys = [
+            ResultCache.key(template.render(seed=chunk_seed, batch_size=size, **template_params))
+            for chunk_seed, size in chunks
+        ]
+
+    return {
+        'settings': settings,
+        'template': template,
+        'template_params': template_params,
+        'chunks': chunks,
+        'keys': keys
+    }
+
+
+async def send_cached_results(interaction: discord.Interaction, plan: dict) -> bool:
+    """Post a job's results straight from the cache if every batch of it is there."""
+    if plan['keys'] is None:
+        return False
+    output_images = []
+    for key in plan['keys']:
+        images = await result_cache.get(key)
+        if images is None:
+            for image_file in output_images:
+                image_file.close()
+            return False
+        output_images.extend(images)
+
+    job_started = time.perf_counter()
+    result = 'failure'
     try:
-        # Use default values from config if not provided
-        steps = steps or config.DEFAULT_KSAMPLER['steps']
-        cfg = cfg or config.DEFAULT_KSAMPLER['cfg']
-        sampler = sampler or config.DEFAULT_KSAMPLER['sampler_name']
-        scheduler = scheduler or config.DEFAULT_KSAMPLER['scheduler']
+        await send_results(interaction, plan['settings'], output_images, True, CACHE_BACKEND)
+        result = 'success'
+        logger.info(f"Sent {len(output_images)} cached image(s) to user {interaction.user}")
+    except Exception as e:
+        logger.error(f"Error sending cached images: {e}", exc_info=True)
+        await interaction.followup.send(f"❌ Error generating image: {str(e)}")
+    finally:
+        metrics.JOBS.inc(CACHE_BACKEND, result)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - job_started, 'total', CACHE_BACKEND)
+    return True
+
+
+async def send_results(
+    interaction: discord.Interaction,
+    settings: dict,
+    output_images: list[BinaryIO],
+    cached: bool,
+    backend_url: str
+):
+    """Re-encode a job's images for this Discord server and post them with the job's settings."""
+    # Re-encode off the event loop so the upload fits this server's limit
+    upload_limit = interaction.guild.filesize_limit if interaction.guild else DEFAULT_UPLOAD_LIMIT
+    with metrics.stage('encode', backend_url):
+        prepared = await image_processor.prepare_outputs(output_images, upload_limit)
 
-        # Set default dimensions for text2img
-        width = width or 512
-        height = height or 512
+    # Send the generated images
+    files = []
+    for idx, (image_file, extension) in enumerate(prepared):
+        files.append(discord.File(image_file, filename=f"generated_{idx}{extension}"))
 
-        # Determine if this is img2img or text2img
-        is_img2img = image is not None
+    # Create embed with generation info
+    embed = build_result_embed(
+        settings['prompt'], settings['negative_prompt'], settings['steps'], settings['cfg'],
+        settings['sampler'], settings['scheduler'], settings['denoise'], settings['width'],
+        settings['height'], settings['seed'], settings['count'], settings['img2img'], settings['checkpoint']
+    )
+    footer = f"Generated by {interaction.user.display_name}"
+    if cached:
+        footer += " | ⚡ Cached result"
+    embed.set_footer(text=footer)
 
-        if is_img2img:
-            # Image-to-image generation
-            denoise = denoise or 0.75
+    with metrics.stage('discord_send', backend_url):
+        await interaction.followup.send(embed=embed, files=files)
+
+
+async def run_generation(
+    interaction: discord.Interaction,
+    job_id: str,
+    plan: dict,
+    input_image: Optional[tuple[bytes, str, str]]
+):
+    """Run one generation job once the scheduler has given it a slot."""
+    settings = plan['settings']
+    backend = None
+    backend_url = ''
+    uploaded = None
+    job_started = time.perf_counter()
+    result = 'failure'
+    try:
+        # Pick the least-loaded ComfyUI server, preferring one with this checkpoint loaded; the whole job stays on it
+        backend = comfy_pool.select(settings['checkpoint'])
+        backend_url = backend.url
+        comfy_client = backend.client
 
-            # Download and upload the input image
+        template = plan['template']
+        template_params = dict(plan['template_params'])
+        if input_image is not None:
+            # Upload the input image to ComfyUI
+            image_data, image_filename, _ = input_image
             await interaction.followup.send("📤 Uploading input image to ComfyUI...")
-            image_data = await image.read()
-
-            # Upload image to ComfyUI
-            uploaded_filename = await comfy_client.upload_image(image_data, image.filename)
-            logger.info(f"Uploaded image: {uploaded_filename}")
-
-            # Create img2img workflow
-            workflow = comfy_client.create_img2img_workflow(
-                image_filename=uploaded_filename,
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                steps=steps,
-                cfg=cfg,
-                sampler_name=sampler,
-                scheduler=scheduler,
-                denoise=denoise,
-                seed=seed
-            )
-        else:
-            # Text-to-image generation
-            denoise = denoise or 1.0
-
-            # Create text2img workflow
-            workflow = comfy_client.create_text2img_workflow(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                width=width,
-                height=height,
-                steps=steps,
-                cfg=cfg,
-                sampler_name=sampler,
-                scheduler=scheduler,
-                denoise=denoise,
-                seed=seed
-            )
+            with metrics.stage('upload', backend_url):
+                uploaded = template_params['image'] = await comfy_client.upload_image(image_data, image_filename)
+            logger.info(f"Uploaded image: {template_params['image']}")
 
-        # Queue the workflow
-        await interaction.followup.send("⚙️ Generating image with ComfyUI...")
-        prompt_id = await comfy_client.queue_prompt(workflow)
-        logger.info(f"Queued prompt: {prompt_id}")
+        # Defaults and the chosen server's own catalog are checked too, before anything is queued
+        chunks = plan['chunks']
+        if comfy_client.catalog is not None:
+            comfy_client.catalog.validate(template, dict(template_params, seed=chunks[0][0], batch_size=chunks[0][1]))
 
-        # Wait for completion
-        history = await comfy_client.wait_for_completion(prompt_id)
+        async def render_chunk(chunk_seed: int, batch_size: int, key: Optional[str]) -> tuple[list[BinaryIO], bool]:
+            workflow = template.render(seed=chunk_seed, batch_size=batch_size, **template_params)
+
+            async def render() -> list[BinaryIO]:
+                # Queue the workflow
+                with metrics.stage('queue_prompt', backend_url):
+                    prompt_id = await comfy_client.queue_prompt(workflow)
+                logger.info(f"Queued prompt: {prompt_id} on {backend.url}")
+                if job_journal is not None:
+                    await job_journal.add_prompt(job_id, prompt_id, backend.url)
+
+                if config.OUTPUT_WEBSOCKET:
+                    # The images arrive on the event socket; nothing to download
+                    return await comfy_client.wait_for_images(
+                        prompt_id, template.output_nodes,
+                        timeout=config.COMFYUI_JOB_TIMEOUT, on_event=reporter.on_event
+                    )
 
-        # Get output images
-        output_images = await comfy_client.get_output_images(history)
+                # Wait for completion
+                history = await comfy_client.wait_for_completion(
+                    prompt_id, timeout=config.COMFYUI_JOB_TIMEOUT, on_event=reporter.on_event
+                )
+
+                # Get output images
+                with metrics.stage('download', backend_url):
+                    return await comfy_client.get_output_images(history)
+
+            if key is not None:
+                # Identical requests that are already running share this one's result
+                return await result_cache.get_or_create(key, render)
+            return await render(), False
+
+        # One message shows live progress and previews while the job runs
+        count = settings['count']
+        status = f"⚙️ Generating {count} images with ComfyUI..." if count > 1 else "⚙️ Generating image with ComfyUI..."
+        status_message = await interaction.followup.send(status, wait=True)
+        if job_journal is not None:
+            await job_journal.set_message(job_id, status_message.id, settings)
+        reporter = ProgressReporter(
+            status_message,
+            status,
+            image_processor,
+            interval=config.PROGRESS_UPDATE_INTERVAL,
+            previews=config.PROGRESS_PREVIEWS,
+            total_steps=settings['steps'] * len(chunks)
+        )
+        reporter.start()
+        # The status message ends with how the job went; errors are detailed in a separate message
+        outcome, finished = "❌ Generation failed", False
+        try:
+            keys = plan['keys'] or [None] * len(chunks)
+            tasks = [
+                asyncio.create_task(render_chunk(chunk_seed, size, key))
+                for (chunk_seed, size), key in zip(chunks, keys)
+            ]
+            try:
+                results = await asyncio.gather(*tasks)
+            except BaseException:
+                # One chunk failed: take the others' prompts off ComfyUI and drop what they downloaded
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                for task in tasks:
+                    if not task.cancelled() and task.exception() is None:
+                        for image in task.result()[0]:
+                            image.close()
+                raise
+            finished = True
+            outcome = "✅ Generation finished" if count == 1 else f"✅ Generated {count} images"
+        except asyncio.CancelledError:
+            outcome = "🛑 Generation cancelled"
+            raise
+        except asyncio.TimeoutError:
+            outcome = "⏱️ Generation timed out"
+            raise
+        finally:
+            if bot.shutting_down and not finished:
+                if job_journal is not None:
+                    outcome = "⏸️ Interrupted by a bot restart; the result will be posted here once the bot is back."
+                else:
+                    outcome = "⏸️ Interrupted by a bot restart."
+            await reporter.close(outcome)
+        output_images = [output for images, _ in results for output in images]
+        cached = all(hit for _, hit in results)
 
         if not output_images:
             await interaction.followup.send("❌ No images were generated.")
             return
 
-        # Send the generated images
-        files = []
-        for idx, img_data in enumerate(output_images):
-            files.append(discord.File(io.BytesIO(img_data), filename=f"generated_{idx}.png"))
+        await send_results(interaction, settings, output_images, cached, backend_url)
+        result = 'success'
+        logger.info(f"Successfully generated {len(output_images)} image(s) for user {interaction.user}")
+
+    except asyncio.CancelledError:
+        result = 'cancelled'
+        raise
+    except asyncio.TimeoutError as e:
+        result = 'timeout'
+        logger.error(f"Generation timed out: {e}")
+        await interaction.followup.send(f"⏱️ {e}. The job was cancelled, please try again later.")
+    except Exception as e:
+        if bot.shutting_down:
+            # ComfyUI keeps working on it; the next start picks the result up from the journal
+            logger.info(f"Job {job_id} interrupted by shutdown: {e}")
+            return
+        if backend is not None and isinstance(e, (aiohttp.ClientError, OSError)):
+            comfy_pool.mark_failed(backend, e)
+        if uploaded is not None:
+            # The failure may be a missing input image; don't trust that the server still has it
+            backend.client.forget_upload(uploaded)
+        logger.error(f"Error generating image: {e}", exc_info=True)
+        await interaction.followup.send(f"❌ Error generating image: {str(e)}")
+    finally:
+        metrics.JOBS.inc(backend_url or 'none', result)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - job_started, 'total', backend_url)
+
+
+def build_result_embed(
+    prompt: str,
+    negative_prompt: Optional[str],
+    steps: int,
+    cfg: float,
+    sampler: str,
+    scheduler: str,
+    denoise: float,
+    width: int,
+    height: int,
+    seed: Optional[int],
+    count: int,
+    is_img2img: bool,
+    checkpoint: str
+) -> discord.Embed:
+    """Embed describing the settings of a finished generation."""
+    embed = discord.Embed(
+        title="✨ Image Generated Successfully",
+        color=discord.Color.green()
+    )
+    embed.add_field(name="Prompt", value=prompt[:1024], inline=False)
+    if negative_prompt:
+        embed.add_field(name="Negative Prompt", value=negative_prompt[:1024], inline=False)
+
+    settings = f"**Steps:** {steps} | **CFG:** {cfg} | **Sampler:** {sampler}\n"
+    settings += f"**Scheduler:** {scheduler} | **Denoise:** {denoise}"
+    if checkpoint != config.DEFAULT_CHECKPOINT:
+        settings += f"\n**Model:** {checkpoint}"
+    if not is_img2img:
+        settings += f"\n**Size:** {width}x{height}"
+    if seed is not None:
+        settings += f"\n**Seed:** {seed}"
+    if count > 1:
+        settings += f"\n**Images:** {count}"
+
+    embed.add_field(name="Settings", value=settings, inline=False)
+    return embed
+
 
-        # Create embed with generation info
-        embed = discord.Embed(
-            title="✨ Image Generated Successfully",
-            color=discord.Color.green()
+async def resume_journaled_jobs():
+    """Deliver the results of jobs that were interrupted by the last shutdown."""
+    jobs = await job_journal.unfinished()
+    if jobs:
+        logger.info(f"Resuming {len(jobs)} job(s) from the journal")
+    await asyncio.gather(*(resume_job(job) for job in jobs))
+
+
+async def resume_job(job: dict):
+    """Pick up one journaled job's prompts from /history and reply in its channel."""
+    mention = f"<@{job['user_id']}>"
+    reference = None
+    if job['message_id']:
+        reference = discord.MessageReference(
+            message_id=job['message_id'], channel_id=job['channel_id'], fail_if_not_exists=False
         )
-        embed.add_field(name="Prompt", value=prompt[:1024], inline=False)
-        if negative_prompt:
-            embed.add_field(name="Negative Prompt", value=negative_prompt[:1024], inline=False)
+    channel = None
+    try:
+        channel = bot.get_channel(job['channel_id']) or await bot.fetch_channel(job['channel_id'])
 
-        settings = f"**Steps:** {steps} | **CFG:** {cfg} | **Sampler:** {sampler}\n"
-        settings += f"**Scheduler:** {scheduler} | **Denoise:** {denoise}"
-        if not is_img2img:
-            settings += f"\n**Size:** {width}x{height}"
-        if seed is not None:
-            settings += f"\n**Seed:** {seed}"
+        if job['state'] == QUEUED or not job['prompts']:
+            await channel.send(
+                f"{mention} ⚠️ The bot restarted before your generation started. Please run `/generate` again.",
+                reference=reference
+            )
+            return
 
-        embed.add_field(name="Settings", value=settings, inline=False)
-        embed.set_footer(text=f"Generated by {interaction.user.display_name}")
+        # The deadline still counts from when the job was accepted
+        timeout = max(0.0, job['created'] + config.COMFYUI_JOB_TIMEOUT - time.time())
+        output_images = []
+        for prompt_id, backend_url in job['prompts']:
+            backend = comfy_pool.backend_for_url(backend_url)
+            if backend is None:
+                raise Exception(f"ComfyUI server {backend_url} is no longer configured")
+            history = await backend.client.wait_for_history(prompt_id, timeout=timeout)
+            output_images.extend(await backend.client.get_output_images(history))
+        if not output_images:
+            # Outputs streamed over the WebSocket went to the previous session and were never saved
+            raise Exception("ComfyUI kept no saved images for it")
+        logger.info(f"Recovered {len(output_images)} image(s) of job {job['job_id']}")
 
-        await interaction.followup.send(embed=embed, files=files)
-        logger.info(f"Successfully generated {len(output_images)} image(s) for user {interaction.user}")
+        guild = getattr(channel, 'guild', None)
+        prepared = await image_processor.prepare_outputs(
+            output_images, guild.filesize_limit if guild else DEFAULT_UPLOAD_LIMIT
+        )
+        files = [
+            discord.File(image_file, filename=f"generated_{idx}{extension}")
+            for idx, (image_file, extension) in enumerate(prepared)
+        ]
 
+        params = job['params']
+        embed = build_result_embed(
+            params['prompt'], params['negative_prompt'], params['steps'], params['cfg'],
+            params['sampler'], params['scheduler'], params['denoise'], params['width'],
+            params['height'], params['seed'], params['count'], params['img2img'],
+            params.get('checkpoint') or config.DEFAULT_CHECKPOINT
+        )
+        embed.set_footer(text="Recovered after a bot restart")
+        await channel.send(
+            f"{mention} here is your generation from before the bot restarted.",
+            embed=embed, files=files, reference=reference
+        )
     except Exception as e:
-        logger.error(f"Error generating image: {e}", exc_info=True)
-        await interaction.followup.send(f"❌ Error generating image: {str(e)}")
+        if bot.shutting_down:
+            return
+        logger.error(f"Failed to resume job {job['job_id']}: {e}", exc_info=True)
+        if channel is not None:
+            try:
+                await channel.send(f"{mention} ❌ Your generation could not be recovered after a restart: {e}", reference=reference)
+            except discord.HTTPException:
+                pass
+    finally:
+        if not bot.shutting_down:
+            await job_journal.finish(job['job_id'])
 
 
 @bot.tree.command(name="ping", description="Check if the bot is responsive")
@@ -208,53 +888,170 @@ async def ping(interaction: discord.Interaction):
     await interaction.response.send_message(f"🏓 Pong! Latency: {round(bot.latency * 1000)}ms")
 
 
+@bot.tree.command(name="cancel", description="Cancel your queued and running generations")
+async def cancel(interaction: discord.Interaction):
+    """Cancel the user's jobs and free the GPU from them."""
+    if shared_queue is not None:
+        # The dispatcher picks the request up on its next poll
+        cancelled = await shared_queue.request_cancel(interaction.user.id)
+    else:
+        cancelled = gpu_scheduler.cancel(interaction.user.id)
+    if cancelled:
+        await interaction.response.send_message(f"🛑 Cancelled {cancelled} job(s).", ephemeral=True)
+    else:
+        await interaction.response.send_message("You have no queued or running jobs.", ephemeral=True)
+
+
 @bot.tree.command(name="comfyui_status", description="Check ComfyUI connection status")
 async def comfyui_status(interaction: discord.Interaction):
-    """Check if ComfyUI server is accessible."""
+    """Check if the ComfyUI servers are accessible."""
     await interaction.response.defer(ephemeral=True)
 
-    try:
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{config.COMFYUI_URL}/system_stats") as response:
-                if response.status == 200:
-                    stats = await response.json()
-                    embed = discord.Embed(
-                        title="✅ ComfyUI Status",
-                        description="ComfyUI server is online and accessible",
-                        color=discord.Color.green()
-                    )
-                    embed.add_field(name="Server URL", value=config.COMFYUI_URL, inline=False)
+    if shared_queue is not None:
+        # As of the dispatcher's last snapshot
+        backends = (await shared_queue.state()).get('backends', [])
+    else:
+        await comfy_pool.poll()
+        backends = backend_status()
+    online = [backend for backend in backends if backend['healthy']]
 
-                    # Add system stats if available
-                    if 'system' in stats:
-                        system = stats['system']
-                        if 'os' in system:
-                            embed.add_field(name="OS", value=system['os'], inline=True)
-                        if 'python_version' in system:
-                            embed.add_field(name="Python", value=system['python_version'], inline=True)
+    embed = discord.Embed(
+        title="✅ ComfyUI Status" if online else "❌ ComfyUI Status",
+        description=f"{len(online)}/{len(backends)} ComfyUI server(s) online and accessible",
+        color=discord.Color.green() if online else discord.Color.red()
+    )
 
-                    await interaction.followup.send(embed=embed, ephemeral=True)
-                else:
-                    await interaction.followup.send(
-                        f"⚠️ ComfyUI server returned status code: {response.status}",
-                        ephemeral=True
-                    )
-    except Exception as e:
-        logger.error(f"Error checking ComfyUI status: {e}")
-        await interaction.followup.send(
-            f"❌ Cannot connect to ComfyUI server at {config.COMFYUI_URL}\nError: {str(e)}",
-            ephemeral=True
+    for backend in backends:
+        if backend['healthy']:
+            value = f"✅ Online | **Queue:** {backend['queue_running']} running, {backend['queue_pending']} pending"
+            system = backend['system']
+            if 'os' in system:
+                value += f"\n**OS:** {system['os']}"
+            if 'python_version' in system:
+                value += f"\n**Python:** {system['python_version']}"
+        else:
+            value = f"❌ Offline ({backend['failures']} failed check(s))"
+        embed.add_field(name=backend['url'], value=value[:1024], inline=False)
+
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+
+@bot.tree.command(name="stats", description="Show where time goes in image generation")
+@app_commands.default_permissions(administrator=True)
+async def stats(interaction: discord.Interaction):
+    """Summarize per-stage latencies and job results since startup."""
+    embed = discord.Embed(title="📊 Generation Stats", color=discord.Color.blurple())
+
+    if shared_queue is not None:
+        # Jobs run in the dispatcher, which publishes its numbers for the frontends
+        state = await shared_queue.state()
+        stages, jobs = state.get('stages', []), state.get('jobs', {})
+        running, pending = state.get('queue', (0, 0))
+    else:
+        stages, jobs = metrics.stage_summary(), metrics.job_summary()
+        running, pending = gpu_scheduler.running, gpu_scheduler.pending
+    if stages:
+        lines = [f"{'stage':<16}{'n':>6}{'p50':>9}{'p95':>9}{'mean':>9}"]
+        for name, count, p50, p95, mean in stages:
+            lines.append(f"{name:<16}{count:>6}{p50:>8.2f}s{p95:>8.2f}s{mean:>8.2f}s")
+        embed.add_field(name="Stage latency", value="```\n" + "\n".join(lines) + "\n```", inline=False)
+    else:
+        embed.description = "No jobs have run yet."
+
+    for backend_url, results in sorted(jobs.items()):
+        value = " | ".join(
+            f"**{name.capitalize()}:** {results.get(name, 0)}"
+            for name in ('success', 'failure', 'timeout', 'cancelled')
         )
+        embed.add_field(name=backend_url, value=value, inline=False)
+
+    footer = f"Queue: {running} running, {pending} pending"
+    if metrics_server is not None and metrics_server.serving:
+        footer += f" | Metrics on {config.METRICS_HOST}:{config.METRICS_PORT}/metrics"
+    embed.set_footer(text=footer)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+def backend_status() -> list[dict]:
+    """Health and queue of every ComfyUI server, as shown by /comfyui_status."""
+    return [
+        {
+            'url': backend.url,
+            'healthy': backend.healthy,
+            'failures': backend.failures,
+            'queue_running': backend.queue_running,
+            'queue_pending': backend.queue_pending,
+            'system': backend.system_stats.get('system', {})
+        }
+        for backend in comfy_pool.backends
+    ]
+
+
+def dispatcher_state() -> dict:
+    """What the frontends need from the dispatcher for autocomplete, /comfyui_status and /stats."""
+    state = {
+        f'options:{class_type}.{input_name}': comfy_pool.options(class_type, input_name)
+        for class_type, input_name in CATALOG_INPUTS
+    }
+    state.update(
+        backends=backend_status(),
+        stages=metrics.stage_summary(),
+        jobs=metrics.job_summary(),
+        queue=(gpu_scheduler.running, gpu_scheduler.pending)
+    )
+    return state
+
+
+async def run_dispatcher():
+    """Run the jobs queued by the frontends on the ComfyUI servers, without connecting to Discord."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    dispatcher = Dispatcher(
+        shared_queue, run_queued_job, gpu_scheduler.cancel, dispatcher_state,
+        poll_interval=config.SHARED_QUEUE_POLL_INTERVAL
+    )
+    warm_up_task = asyncio.create_task(bot.warm_up())
+    try:
+        await workflow_templates.start()
+        if result_cache is not None:
+            await result_cache.start()
+        if metrics_server is not None:
+            await metrics_server.start()
+        await shared_queue.start()
+        await dispatcher.start()
+        logger.info(f"Dispatching jobs from {config.SHARED_QUEUE_PATH}")
+        await stop.wait()
+    finally:
+        bot.shutting_down = True
+        warm_up_task.cancel()
+        await dispatcher.close()
+        if metrics_server is not None:
+            await metrics_server.close()
+        await workflow_templates.close()
+        await comfy_pool.close()
+        image_processor.close()
+        await shared_queue.close()
 
 
 def main():
     """Main function to run the bot."""
+    if config.BOT_MODE == 'dispatcher':
+        logger.info(f"Starting dispatcher with ComfyUI at {', '.join(config.COMFYUI_URLS)}")
+        asyncio.run(run_dispatcher())
+        return
+
     if not config.DISCORD_TOKEN:
         logger.error("DISCORD_TOKEN is not set in .env file")
         return
 
-    logger.info(f"Starting bot with ComfyUI at {config.COMFYUI_URL}")
+    if config.BOT_MODE == 'frontend':
+        logger.info(f"Starting frontend {config.FRONTEND_ID} with jobs queued in {config.SHARED_QUEUE_PATH}")
+    else:
+        logger.info(f"Starting bot with ComfyUI at {', '.join(config.COMFYUI_URLS)}")
     bot.run(config.DISCORD_TOKEN)
 
 
@@ -1,268 +1,459 @@
 import aiohttp
+import asyncio
+import hashlib
 import json
+import mimetypes
+import os
+import tempfile
 import uuid
-import websockets
 import io
-from typing import Optional, Dict, Any
-from PIL import Image
+import time
+from typing import Optional, Dict, Any, Union, BinaryIO, Callable, Collection
 import logging
+from collections import OrderedDict
+
+from comfyui_events import ComfyUIEventDispatcher
+from node_catalog import NodeCatalog, NodeCatalogCache
+import metrics
 
 logger = logging.getLogger('comfyui_client')
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Input images remembered as already on the server; older ones are uploaded again if needed
+MAX_UPLOADED_IMAGES = 256
+
+
+def _hash_image(image_data: Union[bytes, BinaryIO]) -> str:
+    """SHA-256 of an image given as bytes or a seekable file object."""
+    digest = hashlib.sha256()
+    if isinstance(image_data, bytes):
+        digest.update(image_data)
+    else:
+        for chunk in iter(lambda: image_data.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        image_data.seek(0)
+    return digest.hexdigest()
+
+
+async def input_image_name(image_data: Union[bytes, BinaryIO], filename: str) -> str:
+    """Name an input image is uploaded under: its content hash, keeping the extension."""
+    content_hash = await asyncio.to_thread(_hash_image, image_data)
+    extension = os.path.splitext(filename)[1].lower() or '.png'
+    return f"discord_{content_hash[:32]}{extension}"
+
+
+def _history_error(history: Dict[str, Any]) -> Optional[Exception]:
+    """The error a finished prompt's history entry reports, if any."""
+    status = history.get('status', {})
+    if status.get('status_str') == 'error':
+        return Exception(f"Execution error: {status.get('messages')}")
+    return None
+
 
 class ComfyUIClient:
-    def __init__(self, server_url: str):
+    def __init__(
+        self,
+        server_url: str,
+        pool_size: int = 100,
+        pool_size_per_host: int = 0,
+        keepalive_timeout: float = 30.0,
+        download_concurrency: int = 4,
+        spool_threshold: int = 8 * 1024 * 1024,
+        object_info_ttl: float = 600.0
+    ):
         self.server_url = server_url.rstrip('/')
         self.client_id = str(uuid.uuid4())
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.download_concurrency = download_concurrency
+        self.spool_threshold = spool_threshold
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Content-hashed names of input images this server already has, least recently used first
+        self._uploaded: "OrderedDict[str, str]" = OrderedDict()
+        self.events = ComfyUIEventDispatcher(
+            f"{self.server_url.replace('http', 'ws', 1)}/ws?clientId={self.client_id}",
+            on_reconnect=self._recover_prompts
+        )
+        # Node types, samplers, schedulers and models the server accepts
+        self._catalog = NodeCatalogCache(self.get_object_info, ttl=object_info_ttl)
 
-    async def upload_image(self, image_data: bytes, filename: str) -> str:
-        """Upload an image to ComfyUI and return the filename."""
-        async with aiohttp.ClientSession() as session:
-            data = aiohttp.FormData()
-            data.add_field('image', image_data, filename=filename, content_type='image/png')
-            data.add_field('overwrite', 'true')
+    async def start(self):
+        """Open the shared connection-pooled HTTP session, event socket and catalog refresh."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        self.events.start()
+        self._catalog.start()
 
-            async with session.post(f'{self.server_url}/upload/image', data=data) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to upload image: {response.status}")
-                result = await response.json()
-                return result['name']
-
-    async def queue_prompt(self, workflow: Dict[str, Any]) -> str:
-        """Queue a workflow and return the prompt ID."""
-        payload = {
-            'prompt': workflow,
-            'client_id': self.client_id
-        }
+    async def close(self):
+        """Close the event socket, catalog refresh and the shared HTTP session."""
+        await self._catalog.close()
+        await self.events.close()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f'{self.server_url}/prompt', json=payload) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Failed to queue prompt: {response.status} - {error_text}")
-                result = await response.json()
-                return result['prompt_id']
+    @property
+    def catalog(self) -> Optional[NodeCatalog]:
+        """The server's node catalog, refreshed in the background; None until first fetched."""
+        return self._catalog.catalog
+
+    async def warm_up(self, timeout: float = 30.0) -> bool:
+        """Start the client and wait for its event socket and node catalog.
+
+        Returns False if either wasn't ready within timeout seconds; they
+        keep trying in the background.
+        """
+        await self.start()
+        connected, catalog_ready = await asyncio.gather(
+            self.events.wait_connected(timeout),
+            self._catalog.wait_ready(timeout)
+        )
+        return connected and catalog_ready
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, opening it on first use."""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def upload_image(self, image_data: Union[bytes, BinaryIO], filename: str) -> str:
+        """Upload an image to ComfyUI and return the filename.
 
-    async def get_image(self, filename: str, subfolder: str = '', folder_type: str = 'output') -> bytes:
-        """Download a generated image from ComfyUI."""
+        The image is stored under a name derived from its content hash, so
+        different uploads never overwrite each other and an image this
+        server already has is not uploaded again. File objects are streamed.
+        """
+        upload_name = await input_image_name(image_data, filename)
+        if upload_name in self._uploaded:
+            self._uploaded.move_to_end(upload_name)
+            return self._uploaded[upload_name]
+
+        session = await self.get_session()
+        data = aiohttp.FormData()
+        content_type = mimetypes.guess_type(upload_name)[0] or 'application/octet-stream'
+        data.add_field('image', image_data, filename=upload_name, content_type=content_type)
+        data.add_field('overwrite', 'true')
+
+        async with session.post(f'{self.server_url}/upload/image', data=data) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to upload image: {response.status}")
+            result = await response.json()
+
+        self._uploaded[upload_name] = result['name']
+        while len(self._uploaded) > MAX_UPLOADED_IMAGES:
+            self._uploaded.popitem(last=False)
+        return result['name']
+
+    def forget_upload(self, name: str):
+        """Upload this input image again next time, e.g. after a prompt using it failed.
+
+        The server may have lost it (input folder cleaned, server restarted
+        with a new disk), which a prompt naming a missing image fails on.
+        """
+        for upload_name in [key for key, value in self._uploaded.items() if value == name]:
+            del self._uploaded[upload_name]
+
+    async def queue_prompt(self, workflow: Union[Dict[str, Any], str]) -> str:
+        """Queue a workflow and return the prompt ID.
+
+        The workflow may be a dict or already-serialized JSON text.
+        """
+        # Make sure the event socket is listening before the job can start,
+        # otherwise its early events would be lost.
+        await self.events.wait_connected(timeout=5)
+
+        if isinstance(workflow, str):
+            # Splice pre-rendered JSON instead of decoding and re-encoding it
+            body = f'{{"prompt":{workflow},"client_id":{json.dumps(self.client_id)}}}'
+            request_kwargs = {'data': body.encode(), 'headers': {'Content-Type': 'application/json'}}
+        else:
+            request_kwargs = {'json': {'prompt': workflow, 'client_id': self.client_id}}
+
+        session = await self.get_session()
+        async with session.post(f'{self.server_url}/prompt', **request_kwargs) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise Exception(f"Failed to queue prompt: {response.status} - {error_text}")
+            result = await response.json()
+            return result['prompt_id']
+
+    async def download_image(self, filename: str, subfolder: str = '', folder_type: str = 'output') -> BinaryIO:
+        """Stream a generated image from ComfyUI into a rewound file object.
+
+        The image is buffered in memory up to spool_threshold bytes and
+        spills to a temporary file beyond that.
+        """
         params = {'filename': filename, 'subfolder': subfolder, 'type': folder_type}
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f'{self.server_url}/view', params=params) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to get image: {response.status}")
-                return await response.read()
+        session = await self.get_session()
+        async with session.get(f'{self.server_url}/view', params=params) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to get image: {response.status}")
 
-    async def wait_for_completion(self, prompt_id: str, timeout: int = 300) -> Dict[str, Any]:
-        """Wait for a workflow to complete via WebSocket and return the results."""
-        ws_url = f"{self.server_url.replace('http', 'ws')}/ws?clientId={self.client_id}"
+            if (response.content_length or 0) > self.spool_threshold:
+                buffer = tempfile.TemporaryFile()
+            else:
+                buffer = io.BytesIO()
+            try:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    if isinstance(buffer, io.BytesIO) and buffer.tell() + len(chunk) > self.spool_threshold:
+                        spilled = tempfile.TemporaryFile()
+                        spilled.write(buffer.getbuffer())
+                        buffer = spilled
+                    buffer.write(chunk)
+            except BaseException:
+                buffer.close()
+                raise
 
-        try:
-            async with websockets.connect(ws_url) as websocket:
-                async for message in websocket:
-                    data = json.loads(message)
+        buffer.seek(0)
+        return buffer
+
+    async def wait_for_completion(
+        self,
+        prompt_id: str,
+        timeout: int = 300,
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """Wait for a workflow to complete via WebSocket and return the results.
+
+        on_event(event_type, data) is called for every event of the prompt,
+        including 'progress' and 'preview'. It runs on the dispatcher and must not block.
 
-                    if data['type'] == 'executing':
-                        executing_data = data['data']
-                        if executing_data['node'] is None and executing_data.get('prompt_id') == prompt_id:
-                            # Execution finished
-                            return await self._get_history(prompt_id)
+        Raises asyncio.TimeoutError if the prompt hasn't finished within
+        timeout seconds of this call. On timeout or cancellation the prompt
+        is removed from the ComfyUI queue, or interrupted if it is running.
+        """
+        await self._wait(prompt_id, timeout, on_event)
+        with metrics.stage('history', self.server_url):
+            return await self._get_history(prompt_id)
 
-                    elif data['type'] == 'execution_error':
-                        if data['data'].get('prompt_id') == prompt_id:
-                            raise Exception(f"Execution error: {data['data']}")
+    async def wait_for_images(
+        self,
+        prompt_id: str,
+        output_nodes: Collection[str],
+        timeout: int = 300,
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ) -> list[BinaryIO]:
+        """Wait for a workflow whose outputs are SaveImageWebsocket nodes and return their images.
+
+        The images arrive as binary frames while output_nodes execute, so
+        nothing is written to the server's disk and neither /history nor
+        /view is needed. They are not forwarded to on_event as previews.
+        Frames sent while the socket was down are lost; if no image
+        arrived at all, this raises.
+        """
+        images = []
+
+        def listener(event_type: str, data: Dict[str, Any]):
+            if event_type == 'preview' and data.get('node') in output_nodes:
+                images.append(io.BytesIO(data['image']))
+            elif on_event is not None:
+                on_event(event_type, data)
+
+        await self._wait(prompt_id, timeout, listener)
+        if not images:
+            raise Exception("No images arrived over the ComfyUI WebSocket")
+        return images
+
+    async def _wait(
+        self,
+        prompt_id: str,
+        timeout: int,
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]]
+    ):
+        # Queue wait and execution are split at the prompt's execution_start event
+        queued_at = time.perf_counter()
+        started_at = None
+
+        def listener(event_type: str, data: Dict[str, Any]):
+            nonlocal started_at
+            if event_type == 'execution_start' and started_at is None:
+                started_at = time.perf_counter()
+            if on_event is not None:
+                on_event(event_type, data)
 
+        self.events.add_listener(prompt_id, listener)
+        try:
+            await asyncio.wait_for(self.events.watch(prompt_id), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Prompt {prompt_id} did not finish within {timeout:g}s")
+            await self._abandon(prompt_id)
+            raise asyncio.TimeoutError(f"Generation did not finish within {timeout:g} seconds")
+        except asyncio.CancelledError:
+            await self._abandon(prompt_id)
+            raise
         except Exception as e:
-            logger.error(f"WebSocket error: {e}")
+            logger.error(f"Prompt {prompt_id} failed: {e}")
             raise
+        finally:
+            self.events.forget(prompt_id)
 
-    async def _get_history(self, prompt_id: str) -> Dict[str, Any]:
-        """Get the execution history for a prompt."""
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f'{self.server_url}/history/{prompt_id}') as response:
+        finished_at = time.perf_counter()
+        if started_at is None:
+            started_at = queued_at  # Started before we were listening
+        metrics.STAGE_SECONDS.observe(started_at - queued_at, 'queue_wait', self.server_url)
+        metrics.STAGE_SECONDS.observe(finished_at - started_at, 'execution', self.server_url)
+
+    async def cancel_prompt(self, prompt_id: str) -> bool:
+        """Remove a prompt from the queue, or interrupt it if it is already running.
+
+        Returns False if the prompt was no longer queued or running.
+        """
+        session = await self.get_session()
+        queue = await self.get_queue()
+        pending = {item[1] for item in queue.get('queue_pending', [])}
+        running = {item[1] for item in queue.get('queue_running', [])}
+
+        if prompt_id in pending:
+            async with session.post(f'{self.server_url}/queue', json={'delete': [prompt_id]}) as response:
                 if response.status != 200:
-                    raise Exception(f"Failed to get history: {response.status}")
-                history = await response.json()
-                return history.get(prompt_id, {})
+                    raise Exception(f"Failed to delete queued prompt: {response.status}")
+            # It may have started between the two requests
+            queue = await self.get_queue()
+            running = {item[1] for item in queue.get('queue_running', [])}
+            if prompt_id not in running:
+                logger.info(f"Removed prompt {prompt_id} from the queue")
+                return True
+        elif prompt_id not in running:
+            return False
 
-    def create_text2img_workflow(
-        self,
-        prompt: str,
-        negative_prompt: str = "",
-        width: int = 512,
-        height: int = 512,
-        steps: int = 20,
-        cfg: float = 7.0,
-        sampler_name: str = "euler",
-        scheduler: str = "normal",
-        denoise: float = 1.0,
-        seed: Optional[int] = None
-    ) -> Dict[str, Any]:
-        """Create a basic text-to-image workflow."""
-        if seed is None:
-            seed = int(uuid.uuid4().int % (2**32))
-
-        workflow = {
-            "3": {
-                "inputs": {
-                    "seed": seed,
-                    "steps": steps,
-                    "cfg": cfg,
-                    "sampler_name": sampler_name,
-                    "scheduler": scheduler,
-                    "denoise": denoise,
-                    "model": ["4", 0],
-                    "positive": ["6", 0],
-                    "negative": ["7", 0],
-                    "latent_image": ["5", 0]
-                },
-                "class_type": "KSampler"
-            },
-            "4": {
-                "inputs": {
-                    "ckpt_name": "sd_xl_base_1.0.safetensors"
-                },
-                "class_type": "CheckpointLoaderSimple"
-            },
-            "5": {
-                "inputs": {
-                    "width": width,
-                    "height": height,
-                    "batch_size": 1
-                },
-                "class_type": "EmptyLatentImage"
-            },
-            "6": {
-                "inputs": {
-                    "text": prompt,
-                    "clip": ["4", 1]
-                },
-                "class_type": "CLIPTextEncode"
-            },
-            "7": {
-                "inputs": {
-                    "text": negative_prompt,
-                    "clip": ["4", 1]
-                },
-                "class_type": "CLIPTextEncode"
-            },
-            "8": {
-                "inputs": {
-                    "samples": ["3", 0],
-                    "vae": ["4", 2]
-                },
-                "class_type": "VAEDecode"
-            },
-            "9": {
-                "inputs": {
-                    "filename_prefix": "discord_bot",
-                    "images": ["8", 0]
-                },
-                "class_type": "SaveImage"
-            }
-        }
+        # Servers that don't know the prompt_id field interrupt whatever runs, which is this prompt
+        async with session.post(f'{self.server_url}/interrupt', json={'prompt_id': prompt_id}) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to interrupt prompt: {response.status}")
+        logger.info(f"Interrupted prompt {prompt_id}")
+        return True
 
-        return workflow
+    async def _abandon(self, prompt_id: str):
+        """Free the GPU from a prompt nobody waits for anymore."""
+        try:
+            # Shielded so it completes even when the waiting task is being cancelled
+            await asyncio.shield(self.cancel_prompt(prompt_id))
+        except Exception as e:
+            logger.warning(f"Failed to cancel prompt {prompt_id}: {e}")
 
-    def create_img2img_workflow(
-        self,
-        image_filename: str,
-        prompt: str,
-        negative_prompt: str = "",
-        steps: int = 20,
-        cfg: float = 7.0,
-        sampler_name: str = "euler",
-        scheduler: str = "normal",
-        denoise: float = 0.75,
-        seed: Optional[int] = None
-    ) -> Dict[str, Any]:
-        """Create an image-to-image workflow."""
-        if seed is None:
-            seed = int(uuid.uuid4().int % (2**32))
-
-        workflow = {
-            "3": {
-                "inputs": {
-                    "seed": seed,
-                    "steps": steps,
-                    "cfg": cfg,
-                    "sampler_name": sampler_name,
-                    "scheduler": scheduler,
-                    "denoise": denoise,
-                    "model": ["4", 0],
-                    "positive": ["6", 0],
-                    "negative": ["7", 0],
-                    "latent_image": ["10", 0]
-                },
-                "class_type": "KSampler"
-            },
-            "4": {
-                "inputs": {
-                    "ckpt_name": "sd_xl_base_1.0.safetensors"
-                },
-                "class_type": "CheckpointLoaderSimple"
-            },
-            "6": {
-                "inputs": {
-                    "text": prompt,
-                    "clip": ["4", 1]
-                },
-                "class_type": "CLIPTextEncode"
-            },
-            "7": {
-                "inputs": {
-                    "text": negative_prompt,
-                    "clip": ["4", 1]
-                },
-                "class_type": "CLIPTextEncode"
-            },
-            "8": {
-                "inputs": {
-                    "samples": ["3", 0],
-                    "vae": ["4", 2]
-                },
-                "class_type": "VAEDecode"
-            },
-            "9": {
-                "inputs": {
-                    "filename_prefix": "discord_bot",
-                    "images": ["8", 0]
-                },
-                "class_type": "SaveImage"
-            },
-            "10": {
-                "inputs": {
-                    "pixels": ["11", 0],
-                    "vae": ["4", 2]
-                },
-                "class_type": "VAEEncode"
-            },
-            "11": {
-                "inputs": {
-                    "image": image_filename,
-                    "upload": "image"
-                },
-                "class_type": "LoadImage"
-            }
+    async def _recover_prompts(self, prompt_ids: list[str]):
+        """Settle prompts whose events may have been missed while the socket was down."""
+        queue = await self.get_queue()
+        active = {
+            item[1]
+            for key in ('queue_running', 'queue_pending')
+            for item in queue.get(key, [])
         }
+        for prompt_id in prompt_ids:
+            if prompt_id in active:
+                continue  # Still going; its events will arrive on the new socket
+            history = await self._get_history(prompt_id)
+            if not history:
+                self.events.finish(prompt_id, Exception("The prompt was lost while ComfyUI was unreachable"))
+                continue
+            self.events.finish(prompt_id, _history_error(history))
+            logger.info(f"Recovered prompt {prompt_id} from history after reconnecting")
 
-        return workflow
+    async def wait_for_history(self, prompt_id: str, timeout: float = 300, poll_interval: float = 2.0) -> Dict[str, Any]:
+        """Wait for a prompt queued by an earlier session by polling /history.
 
-    async def get_output_images(self, history: Dict[str, Any]) -> list[bytes]:
-        """Extract and download output images from execution history."""
-        images = []
+        ComfyUI only sends a prompt's events to the client that queued it,
+        so a bot that restarted has to poll. Raises if the prompt failed or
+        is unknown to the server, and cancels it after timeout seconds.
+        """
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            history = await self._get_history(prompt_id)
+            if not history:
+                queue = await self.get_queue()
+                active = {
+                    item[1]
+                    for key in ('queue_running', 'queue_pending')
+                    for item in queue.get(key, [])
+                }
+                if prompt_id not in active:
+                    # It may have finished between the two requests
+                    history = await self._get_history(prompt_id)
+                    if not history:
+                        raise Exception("ComfyUI no longer knows this prompt")
+            if history:
+                error = _history_error(history)
+                if error is not None:
+                    raise error
+                return history
+            if asyncio.get_running_loop().time() >= deadline:
+                await self._abandon(prompt_id)
+                raise asyncio.TimeoutError(f"Generation did not finish within {timeout:g} seconds")
+            await asyncio.sleep(poll_interval)
+
+    async def get_queue(self) -> Dict[str, Any]:
+        """Get the running and pending queue of the server."""
+        session = await self.get_session()
+        async with session.get(f'{self.server_url}/queue') as response:
+            if response.status != 200:
+                raise Exception(f"Failed to get queue: {response.status}")
+            return await response.json()
+
+    async def get_system_stats(self) -> Dict[str, Any]:
+        """Get system and device information of the server."""
+        session = await self.get_session()
+        async with session.get(f'{self.server_url}/system_stats') as response:
+            if response.status != 200:
+                raise Exception(f"Failed to get system stats: {response.status}")
+            return await response.json()
 
+    async def get_object_info(self) -> Dict[str, Any]:
+        """Get the input specs of every node type the server has."""
+        session = await self.get_session()
+        async with session.get(f'{self.server_url}/object_info') as response:
+            if response.status != 200:
+                raise Exception(f"Failed to get object info: {response.status}")
+            body = await response.read()
+        # Several MB of JSON; decode it off the event loop
+        return await asyncio.to_thread(json.loads, body)
+
+    async def _get_history(self, prompt_id: str) -> Dict[str, Any]:
+        """Get the execution history for a prompt."""
+        session = await self.get_session()
+        async with session.get(f'{self.server_url}/history/{prompt_id}') as response:
+            if response.status != 200:
+                raise Exception(f"Failed to get history: {response.status}")
+            history = await response.json()
+            return history.get(prompt_id, {})
+
+    async def get_output_images(self, history: Dict[str, Any]) -> list[BinaryIO]:
+        """Extract and download output images from execution history.
+
+        Images are downloaded concurrently and returned as rewound file
+        objects in output order.
+        """
         if 'outputs' not in history:
-            return images
-
-        for node_id, node_output in history['outputs'].items():
-            if 'images' in node_output:
-                for image_info in node_output['images']:
-                    image_data = await self.get_image(
-                        image_info['filename'],
-                        image_info.get('subfolder', ''),
-                        image_info.get('type', 'output')
-                    )
-                    images.append(image_data)
+            return []
 
-        return images
+        image_infos = [
+            image_info
+            for node_output in history['outputs'].values()
+            for image_info in node_output.get('images', [])
+        ]
+        semaphore = asyncio.Semaphore(self.download_concurrency)
+
+        async def download(image_info: Dict[str, Any]) -> BinaryIO:
+            async with semaphore:
+                return await self.download_image(
+                    image_info['filename'],
+                    image_info.get('subfolder', ''),
+                    image_info.get('type', 'output')
+                )
+
+        results = await asyncio.gather(*(download(info) for info in image_infos), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            for result in results:
+                if not isinstance(result, BaseException):
+                    result.close()
+            raise errors[0]
+        return results
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import struct
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Awaitable, List
+
+import websockets
+
+logger = logging.getLogger('comfyui_events')
+
+# Terminal events that arrive before anyone is watching the prompt are kept
+# for a short while so a waiter registered right after queue_prompt still sees them.
+MAX_UNCLAIMED_RESULTS = 1000
+
+# Binary frame types sent by ComfyUI
+PREVIEW_IMAGE = 1
+PREVIEW_IMAGE_WITH_METADATA = 4
+PREVIEW_FORMATS = {1: 'jpeg', 2: 'png'}
+
+# Largest frame accepted; SaveImageWebsocket sends full-size PNGs, far past the 1 MiB default
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024
+
+
+class ComfyUIEventDispatcher:
+    """Single persistent ComfyUI WebSocket shared by every job of one client.
+
+    Messages are decoded once and routed to the future (and optional
+    listeners) registered for their prompt_id. Binary preview frames are
+    passed to listeners as 'preview' events, with the id of the node that
+    sent them; they are only sliced out of the frame when someone is
+    listening. SaveImageWebsocket outputs arrive the same way.
+
+    Events sent while the socket was down are lost. After a reconnect,
+    on_reconnect(prompt_ids) is called with every prompt still being
+    watched so their state can be recovered some other way.
+    """
+
+    def __init__(
+        self,
+        ws_url: str,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        on_reconnect: Optional[Callable[[List[str]], Awaitable[None]]] = None
+    ):
+        self.ws_url = ws_url
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.on_reconnect = on_reconnect
+        self._task: Optional[asyncio.Task] = None
+        self._recover_task: Optional[asyncio.Task] = None
+        self._connected: Optional[asyncio.Event] = None
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._listeners: Dict[str, List[Callable[[str, Dict[str, Any]], None]]] = {}
+        self._unclaimed: "OrderedDict[str, Optional[Exception]]" = OrderedDict()
+        # Prompt and node currently executing; plain preview frames don't name them
+        self._executing: Optional[str] = None
+        self._executing_node: Optional[str] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected is not None and self._connected.is_set()
+
+    def start(self):
+        """Start the background connection loop if it is not running."""
+        if self._connected is None:
+            self._connected = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the connection loop and fail every pending waiter."""
+        for task in (self._task, self._recover_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._recover_task = None
+        if self._connected is not None:
+            self._connected.clear()
+        for future in self._waiters.values():
+            if not future.done():
+                future.set_exception(Exception("ComfyUI event dispatcher closed"))
+        self._waiters.clear()
+        self._listeners.clear()
+
+    async def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the socket is connected. Returns False on timeout."""
+        self.start()
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def watch(self, prompt_id: str) -> asyncio.Future:
+        """Return a future that resolves when the prompt finishes executing.
+
+        The future raises if ComfyUI reports an execution error.
+        """
+        future = self._waiters.get(prompt_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[prompt_id] = future
+            if prompt_id in self._unclaimed:
+                self._resolve(prompt_id, self._unclaimed.pop(prompt_id))
+        return future
+
+    def add_listener(self, prompt_id: str, callback: Callable[[str, Dict[str, Any]], None]):
+        """Call callback(event_type, data) for every event of this prompt."""
+        self._listeners.setdefault(prompt_id, []).append(callback)
+
+    def finish(self, prompt_id: str, error: Optional[Exception] = None):
+        """Mark a prompt as finished, e.g. from its history after missed events."""
+        self._finish(prompt_id, error)
+
+    def forget(self, prompt_id: str):
+        """Drop the waiter and listeners of a prompt."""
+        self._waiters.pop(prompt_id, None)
+        self._listeners.pop(prompt_id, None)
+        self._unclaimed.pop(prompt_id, None)
+
+    async def _run(self):
+        delay = self.reconnect_delay
+        reconnecting = False
+        while True:
+            try:
+                # A short close timeout keeps shutdown quick when the server is slow to answer the close.
+                # Previews and outputs are already compressed images; deflating them again only burns CPU.
+                async with websockets.connect(
+                    self.ws_url, close_timeout=1, max_size=MAX_MESSAGE_SIZE, compression=None
+                ) as websocket:
+                    logger.info(f"Connected to ComfyUI WebSocket at {self.ws_url}")
+                    self._connected.set()
+                    delay = self.reconnect_delay
+                    if reconnecting and self._waiters and self.on_reconnect is not None:
+                        # Recover in the background so the socket keeps being read
+                        self._recover_task = asyncio.create_task(self._recover(list(self._waiters)))
+                    reconnecting = True
+                    async for message in websocket:
+                        if isinstance(message, str):
+                            self._dispatch(json.loads(message))
+                        else:
+                            self._dispatch_binary(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"ComfyUI WebSocket disconnected: {e}")
+            self._connected.clear()
+            self._executing = None
+            self._executing_node = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _recover(self, prompt_ids: List[str]):
+        try:
+            await self.on_reconnect(prompt_ids)
+        except Exception as e:
+            logger.warning(f"Failed to recover prompts after reconnecting: {e}")
+
+    def _dispatch(self, message: Dict[str, Any]):
+        event_type = message.get('type')
+        data = message.get('data') or {}
+        prompt_id = data.get('prompt_id')
+        if prompt_id is None:
+            return
+
+        self._notify(prompt_id, event_type, data)
+
+        if event_type == 'execution_start':
+            self._executing = prompt_id
+            self._executing_node = None
+        elif event_type == 'executing' and data.get('node') is not None:
+            self._executing = prompt_id
+            self._executing_node = data['node']
+        elif event_type == 'executing' and data.get('node') is None:
+            # Sent once /history has the outputs; execution_success comes earlier, before they are stored
+            if self._executing == prompt_id:
+                self._executing = None
+                self._executing_node = None
+            self._finish(prompt_id, None)
+        elif event_type == 'execution_error':
+            self._finish(prompt_id, Exception(f"Execution error: {data}"))
+        elif event_type == 'execution_interrupted':
+            self._finish(prompt_id, Exception(f"Execution interrupted: {data}"))
+
+    def _dispatch_binary(self, message: bytes):
+        if len(message) < 8:
+            return
+        frame_type, = struct.unpack_from('>I', message, 0)
+        if frame_type == PREVIEW_IMAGE:
+            prompt_id = self._executing
+            if prompt_id not in self._listeners:
+                return
+            node = self._executing_node
+            image_format, = struct.unpack_from('>I', message, 4)
+            image = message[8:]
+            image_format = PREVIEW_FORMATS.get(image_format, 'jpeg')
+        elif frame_type == PREVIEW_IMAGE_WITH_METADATA:
+            metadata_length, = struct.unpack_from('>I', message, 4)
+            metadata = json.loads(message[8:8 + metadata_length])
+            prompt_id = metadata.get('prompt_id')
+            if prompt_id not in self._listeners:
+                return
+            node = metadata.get('node_id')
+            image = message[8 + metadata_length:]
+            image_format = metadata.get('image_type', 'image/jpeg').split('/')[-1]
+        else:
+            return
+        self._notify(prompt_id, 'preview', {'prompt_id': prompt_id, 'node': node, 'image': image, 'format': image_format})
+
+    def _notify(self, prompt_id: str, event_type: str, data: Dict[str, Any]):
+        for callback in self._listeners.get(prompt_id, ()):
+            try:
+                callback(event_type, data)
+            except Exception as e:
+                logger.error(f"Event listener for {prompt_id} failed: {e}", exc_info=True)
+
+    def _finish(self, prompt_id: str, error: Optional[Exception]):
+        if prompt_id in self._waiters:
+            self._resolve(prompt_id, error)
+            return
+        self._unclaimed[prompt_id] = error
+        while len(self._unclaimed) > MAX_UNCLAIMED_RESULTS:
+            self._unclaimed.popitem(last=False)
+
+    def _resolve(self, prompt_id: str, error: Optional[Exception]):
+        future = self._waiters.get(prompt_id)
+        if future is None or future.done():
+            return
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List
+
+from comfyui_client import ComfyUIClient
+from node_catalog import WorkflowValidationError
+from workflow_templates import WorkflowTemplate
+
+logger = logging.getLogger('comfyui_pool')
+
+# Node whose ckpt_name options list the checkpoints a server has
+CHECKPOINT_LOADER = 'CheckpointLoaderSimple'
+
+
+class ComfyUIBackend:
+    """One ComfyUI server in the pool and its last known load."""
+
+    def __init__(self, client: ComfyUIClient):
+        self.client = client
+        self.healthy = True
+        self.failures = 0
+        self.queue_running = 0
+        self.queue_pending = 0
+        self.system_stats: Dict[str, Any] = {}
+        # Jobs sent here since the last poll, so bursts between polls spread out
+        self.dispatched_since_poll = 0
+        # Checkpoint of the last job sent here; it stays loaded until another one is needed
+        self.loaded_model: Optional[str] = None
+
+    @property
+    def url(self) -> str:
+        return self.client.server_url
+
+    @property
+    def load(self) -> int:
+        return self.queue_running + self.queue_pending + self.dispatched_since_poll
+
+    @property
+    def vram_free(self) -> int:
+        devices = self.system_stats.get('devices') or []
+        return sum(device.get('vram_free', 0) for device in devices)
+
+    def has_model(self, model: str) -> bool:
+        """False only if the server's catalog is known and lacks this checkpoint."""
+        catalog = self.client.catalog
+        return catalog is None or model in catalog.options(CHECKPOINT_LOADER, 'ckpt_name')
+
+
+class ComfyUIBackendPool:
+    """Load-balances jobs across several ComfyUI servers.
+
+    Each server's /queue and /system_stats are polled in the background.
+    Jobs go to the healthy backend with the shortest queue and stay on it:
+    callers keep the backend's client for the job's history and image
+    fetches. A backend that would have to load a different checkpoint
+    counts model_swap_cost extra queued jobs.
+    """
+
+    def __init__(
+        self,
+        server_urls: List[str],
+        poll_interval: float = 5.0,
+        max_failures: int = 3,
+        model_swap_cost: int = 2,
+        **client_kwargs
+    ):
+        if not server_urls:
+            raise ValueError("At least one ComfyUI server URL is required")
+        self.backends = [ComfyUIBackend(ComfyUIClient(url, **client_kwargs)) for url in server_urls]
+        self.poll_interval = poll_interval
+        self.max_failures = max_failures
+        self.model_swap_cost = model_swap_cost
+        self._poll_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Open every client, take a first load sample and start polling."""
+        await asyncio.gather(*(backend.client.start() for backend in self.backends))
+        await self.poll()
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def warm_up(self, timeout: float = 30.0):
+        """Start the pool, then wait for every server's event socket and node catalog."""
+        await self.start()
+        ready = await asyncio.gather(*(backend.client.warm_up(timeout) for backend in self.backends))
+        for backend, backend_ready in zip(self.backends, ready):
+            if not backend_ready:
+                logger.warning(f"ComfyUI backend {backend.url} was not ready within {timeout:g}s")
+
+    async def close(self):
+        """Stop polling and close every client."""
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+        await asyncio.gather(*(backend.client.close() for backend in self.backends))
+
+    async def poll(self):
+        """Refresh the load and health of every backend."""
+        await asyncio.gather(*(self._poll_backend(backend) for backend in self.backends))
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Backend poll failed: {e}", exc_info=True)
+
+    async def _poll_backend(self, backend: ComfyUIBackend):
+        try:
+            queue, stats = await asyncio.gather(
+                backend.client.get_queue(),
+                backend.client.get_system_stats()
+            )
+        except Exception as e:
+            self.mark_failed(backend, e)
+            return
+
+        backend.queue_running = len(queue.get('queue_running', []))
+        backend.queue_pending = len(queue.get('queue_pending', []))
+        backend.system_stats = stats
+        backend.dispatched_since_poll = 0
+        backend.failures = 0
+        if not backend.healthy:
+            backend.healthy = True
+            logger.info(f"ComfyUI backend {backend.url} is back in rotation")
+
+    def mark_failed(self, backend: ComfyUIBackend, error: Optional[Exception] = None):
+        """Record a failure; the backend leaves rotation after max_failures in a row."""
+        backend.failures += 1
+        if backend.healthy and backend.failures >= self.max_failures:
+            backend.healthy = False
+            logger.warning(f"ComfyUI backend {backend.url} taken out of rotation: {error}")
+
+    def select(self, model: Optional[str] = None) -> ComfyUIBackend:
+        """Pick the healthy backend that can start a new job for this checkpoint soonest."""
+        healthy = [backend for backend in self.backends if backend.healthy]
+        if not healthy:
+            raise Exception("No healthy ComfyUI backends available")
+        if model is not None:
+            # Servers known not to have the checkpoint are a last resort
+            healthy = [backend for backend in healthy if backend.has_model(model)] or healthy
+
+        def cost(b: ComfyUIBackend):
+            swap = self.model_swap_cost if model is not None and b.loaded_model not in (None, model) else 0
+            return (b.load + swap, -b.vram_free)
+
+        backend = min(healthy, key=cost)
+        backend.dispatched_since_poll += 1
+        if model is not None:
+            backend.loaded_model = model
+        return backend
+
+    def loaded_models(self) -> List[str]:
+        """Checkpoints currently loaded on healthy backends."""
+        return [b.loaded_model for b in self.backends if b.healthy and b.loaded_model is not None]
+
+    def options(self, class_type: str, input_name: str) -> List[str]:
+        """Values a combo input accepts on any healthy backend, e.g. its checkpoints."""
+        values: Dict[str, None] = {}
+        for backend in self.backends:
+            catalog = backend.client.catalog
+            if backend.healthy and catalog is not None:
+                values.update(dict.fromkeys(catalog.options(class_type, input_name)))
+        return list(values)
+
+    def validate(self, template: WorkflowTemplate, params: Dict[str, Any]):
+        """Raise WorkflowValidationError unless some healthy backend would accept these parameters.
+
+        Backends whose catalog hasn't been fetched yet are given the benefit of the doubt.
+        """
+        error = None
+        for backend in self.backends:
+            if not backend.healthy:
+                continue
+            catalog = backend.client.catalog
+            if catalog is None:
+                return
+            try:
+                catalog.validate(template, params)
+                return
+            except WorkflowValidationError as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def backend_for_url(self, url: str) -> Optional[ComfyUIBackend]:
+        """The backend with this server URL, if it is still configured."""
+        url = url.rstrip('/')
+        return next((backend for backend in self.backends if backend.url == url), None)
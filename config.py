@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -11,10 +12,105 @@ ALLOWED_CHANNEL_ID = os.getenv('ALLOWED_CHANNEL_ID')
 # ComfyUI Configuration
 COMFYUI_URL = os.getenv('COMFYUI_URL', 'http://127.0.0.1:8188')
 
+# Optional comma-separated list of ComfyUI servers to load-balance across.
+# Falls back to COMFYUI_URL when unset.
+COMFYUI_URLS = [url.strip() for url in os.getenv('COMFYUI_URLS', '').split(',') if url.strip()] or [COMFYUI_URL]
+COMFYUI_POLL_INTERVAL = float(os.getenv('COMFYUI_POLL_INTERVAL', '5'))  # seconds between /queue polls
+COMFYUI_JOB_TIMEOUT = float(os.getenv('COMFYUI_JOB_TIMEOUT', '300'))  # seconds a prompt may take before it is cancelled
+COMFYUI_MAX_FAILURES = int(os.getenv('COMFYUI_MAX_FAILURES', '3'))  # failures before a backend leaves rotation
+COMFYUI_MODEL_SWAP_COST = int(os.getenv('COMFYUI_MODEL_SWAP_COST', '2'))  # queued jobs a checkpoint swap is worth when picking a server
+COMFYUI_OBJECT_INFO_TTL = float(os.getenv('COMFYUI_OBJECT_INFO_TTL', '600'))  # seconds between /object_info refreshes
+COMFYUI_WARM_UP_TIMEOUT = float(os.getenv('COMFYUI_WARM_UP_TIMEOUT', '30'))  # seconds before a server that is slow to connect at startup is logged
+
+# HTTP connection pool shared by all requests to ComfyUI
+COMFYUI_POOL_SIZE = int(os.getenv('COMFYUI_POOL_SIZE', '100'))
+COMFYUI_POOL_SIZE_PER_HOST = int(os.getenv('COMFYUI_POOL_SIZE_PER_HOST', '0'))  # 0 = no per-host limit
+COMFYUI_KEEPALIVE_TIMEOUT = float(os.getenv('COMFYUI_KEEPALIVE_TIMEOUT', '30'))
+
+# Output image downloads
+OUTPUT_DOWNLOAD_CONCURRENCY = int(os.getenv('OUTPUT_DOWNLOAD_CONCURRENCY', '4'))  # parallel downloads per job
+OUTPUT_SPOOL_THRESHOLD_MB = float(os.getenv('OUTPUT_SPOOL_THRESHOLD_MB', '8'))  # larger images spill to a temp file
+OUTPUT_WEBSOCKET = os.getenv('OUTPUT_WEBSOCKET', 'false').lower() in ('1', 'true', 'yes')  # stream outputs via SaveImageWebsocket, nothing saved on the server
+
+# Bot-side job scheduler
+SCHEDULER_MAX_CONCURRENT = int(os.getenv('SCHEDULER_MAX_CONCURRENT', str(2 * len(COMFYUI_URLS))))  # jobs running at once
+SCHEDULER_MAX_QUEUE_DEPTH = int(os.getenv('SCHEDULER_MAX_QUEUE_DEPTH', '50'))  # waiting jobs before new ones are rejected
+SCHEDULER_MAX_USER_JOBS = int(os.getenv('SCHEDULER_MAX_USER_JOBS', '3'))  # queued + running jobs per user
+SCHEDULER_MAX_GUILD_JOBS = int(os.getenv('SCHEDULER_MAX_GUILD_JOBS', '20'))  # queued + running jobs per server
+SCHEDULER_MAX_MODEL_SKIPS = int(os.getenv('SCHEDULER_MAX_MODEL_SKIPS', '4'))  # times a job may be passed over to avoid a model swap
+
+# GPU budgets in credits: a 20-step 512x512 image costs 1, cost scales with steps x pixels x images.
+# Budgets refill at the per-minute rate up to the burst size; a rate of 0 disables that limit.
+RATE_LIMIT_USER_PER_MINUTE = float(os.getenv('RATE_LIMIT_USER_PER_MINUTE', '10'))
+RATE_LIMIT_USER_BURST = float(os.getenv('RATE_LIMIT_USER_BURST', '40'))  # also the most a single request may cost
+RATE_LIMIT_GUILD_PER_MINUTE = float(os.getenv('RATE_LIMIT_GUILD_PER_MINUTE', '60'))
+RATE_LIMIT_GUILD_BURST = float(os.getenv('RATE_LIMIT_GUILD_BURST', '200'))
+
+# Output encoding for Discord uploads
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'webp').lower()  # webp, jpeg or png
+OUTPUT_QUALITY = int(os.getenv('OUTPUT_QUALITY', '90'))
+OUTPUT_GRID = os.getenv('OUTPUT_GRID', 'false').lower() in ('1', 'true', 'yes')  # combine batches into one image
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))  # processes used for image encoding and preprocessing
+
+# img2img input preprocessing
+INPUT_MAX_PIXELS = int(os.getenv('INPUT_MAX_PIXELS', str(1024 * 1024)))  # inputs are scaled down to this area
+INPUT_FORMAT = os.getenv('INPUT_FORMAT', 'jpeg').lower()  # jpeg, webp or png
+INPUT_QUALITY = int(os.getenv('INPUT_QUALITY', '95'))
+
+# Live progress while a job runs
+PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', '2'))  # seconds between message edits
+PROGRESS_PREVIEWS = os.getenv('PROGRESS_PREVIEWS', 'true').lower() in ('1', 'true', 'yes')  # needs ComfyUI --preview-method
+
+# Result cache for fixed-seed requests
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', 'cache/results')
+RESULT_CACHE_MEMORY_MB = int(os.getenv('RESULT_CACHE_MEMORY_MB', '64'))
+RESULT_CACHE_DISK_MB = int(os.getenv('RESULT_CACHE_DISK_MB', '1024'))
+
+# Journal of unfinished jobs, resumed after a restart
+JOB_JOURNAL_ENABLED = os.getenv('JOB_JOURNAL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+JOB_JOURNAL_PATH = os.getenv('JOB_JOURNAL_PATH', 'cache/jobs.sqlite3')
+
+# Hash of the last synced slash commands; commands are only re-synced when it changes
+COMMAND_TREE_HASH_PATH = os.getenv('COMMAND_TREE_HASH_PATH', 'cache/command_tree.sha256')
+
+# Scaling out: 'standalone' runs everything in one process; 'frontend' processes only talk to Discord and
+# queue jobs in SHARED_QUEUE_PATH for the one 'dispatcher' process, which owns the ComfyUI connections
+BOT_MODE = os.getenv('BOT_MODE', 'standalone').lower()
+SHARD_COUNT = int(os.getenv('SHARD_COUNT') or 0) or None  # total shards across all frontends; unset lets Discord decide
+SHARD_IDS = [int(shard) for shard in os.getenv('SHARD_IDS', '').split(',') if shard.strip()] or None  # shards run by this process
+SHARED_QUEUE_PATH = os.getenv('SHARED_QUEUE_PATH', 'cache/queue.sqlite3')
+SHARED_QUEUE_POLL_INTERVAL = float(os.getenv('SHARED_QUEUE_POLL_INTERVAL') or 0.25)  # seconds between checks for new jobs and results
+FRONTEND_ID = os.getenv('FRONTEND_ID') or f"{socket.gethostname()}-{os.getpid()}"  # results are routed back by this name
+
+# Local Prometheus-style metrics endpoint (0 disables it)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
 # Validate required settings
-if not DISCORD_TOKEN:
+if BOT_MODE not in ('standalone', 'frontend', 'dispatcher'):
+    raise ValueError("BOT_MODE must be standalone, frontend or dispatcher")
+if SHARD_IDS is not None and SHARD_COUNT is None:
+    raise ValueError("SHARD_COUNT must be set when SHARD_IDS is")
+if not DISCORD_TOKEN and BOT_MODE != 'dispatcher':
     raise ValueError("DISCORD_TOKEN must be set in .env file")
 
+# Batch generation
+BATCH_MAX_COUNT = min(10, int(os.getenv('BATCH_MAX_COUNT', '4')))  # images per /generate (Discord allows 10 attachments)
+BATCH_MAX_PIXELS = int(os.getenv('BATCH_MAX_PIXELS', str(4 * 1024 * 1024)))  # pixels per GPU batch before it is split
+
+# Workflow templates (ComfyUI API-format JSON files)
+# Relative paths are resolved next to this file, so the bot can be started from any directory
+WORKFLOWS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.getenv('WORKFLOWS_DIR', 'workflows'))
+WORKFLOWS_RELOAD_INTERVAL = float(os.getenv('WORKFLOWS_RELOAD_INTERVAL', '2'))  # seconds between checks for changed files
+
+# Checkpoint model used by the workflows
+DEFAULT_CHECKPOINT = os.getenv('DEFAULT_CHECKPOINT', 'sd_xl_base_1.0.safetensors')
+# Checkpoints suggested on /generate (comma-separated) until the servers' model lists are known; always includes the default
+CHECKPOINTS = list(dict.fromkeys(
+    [DEFAULT_CHECKPOINT] + [name.strip() for name in os.getenv('CHECKPOINTS', '').split(',') if name.strip()]
+))
+
 # Default KSampler settings
 DEFAULT_KSAMPLER = {
     'steps': 20,
@@ -0,0 +1,251 @@
+import asyncio
+import io
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, Tuple, BinaryIO, TYPE_CHECKING
+
+# Pillow is imported where it is used: the bot process itself never touches
+# pixels, and the worker processes load it on their first job (or warm_up).
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger('image_processing')
+
+EXTENSIONS = {'png': '.png', 'webp': '.webp', 'jpeg': '.jpg'}
+
+# Discord's attachment limit for servers without boosts
+DEFAULT_UPLOAD_LIMIT = 10 * 1024 * 1024
+
+# Smallest side an image is shrunk to while trying to fit the upload limit
+MIN_FIT_SIZE = 256
+
+# Latent dimensions must be multiples of this
+DIMENSION_MULTIPLE = 64
+
+
+def _load_pillow():
+    """Import Pillow and its codecs ahead of the first real job. Runs in a worker process."""
+    from PIL import Image
+    Image.init()
+
+
+def _encode(image: 'Image.Image', image_format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == 'jpeg':
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(buffer, 'JPEG', quality=quality, optimize=True)
+    elif image_format == 'webp':
+        image.save(buffer, 'WEBP', quality=quality, method=4)
+    else:
+        image.save(buffer, 'PNG', optimize=False)
+    return buffer.getvalue()
+
+
+def _fit(image: 'Image.Image', image_format: str, quality: int, max_bytes: int) -> Tuple[bytes, str]:
+    """Encode an image, lowering quality and then size until it fits max_bytes."""
+    from PIL import Image
+
+    if image_format == 'png':
+        data = _encode(image, 'png', quality)
+        if len(data) <= max_bytes:
+            return data, 'png'
+        image_format = 'webp'  # Lossless doesn't fit, fall back to lossy
+
+    qualities = [q for q in (quality, 80, 65, 50) if q <= quality]
+    resized = image
+    while True:
+        for q in qualities:
+            data = _encode(resized, image_format, q)
+            if len(data) <= max_bytes:
+                return data, image_format
+        width, height = resized.size
+        if min(width, height) * 0.75 < MIN_FIT_SIZE:
+            return data, image_format  # Best effort
+        resized = resized.resize((int(width * 0.75), int(height * 0.75)), Image.LANCZOS)
+
+
+def transcode_image(data: bytes, image_format: str, quality: int, max_bytes: int) -> Tuple[bytes, str]:
+    """Re-encode one image to fit max_bytes. Runs in a worker process."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        return _fit(image, image_format, quality, max_bytes)
+
+
+def build_grid(images: List[bytes], image_format: str, quality: int, max_bytes: int) -> Tuple[bytes, str]:
+    """Tile several images into one grid image. Runs in a worker process."""
+    from PIL import Image
+
+    tiles = []
+    for data in images:
+        with Image.open(io.BytesIO(data)) as image:
+            tiles.append(image.convert('RGB'))
+
+    columns = math.ceil(math.sqrt(len(tiles)))
+    rows = math.ceil(len(tiles) / columns)
+    cell_width = max(tile.width for tile in tiles)
+    cell_height = max(tile.height for tile in tiles)
+
+    grid = Image.new('RGB', (columns * cell_width, rows * cell_height))
+    for idx, tile in enumerate(tiles):
+        grid.paste(tile, ((idx % columns) * cell_width, (idx // columns) * cell_height))
+    return _fit(grid, image_format, quality, max_bytes)
+
+
+def preprocess_input(data: bytes, max_pixels: int, image_format: str, quality: int) -> Tuple[bytes, str]:
+    """Validate and normalize an img2img input. Runs in a worker process.
+
+    Applies EXIF rotation, drops all metadata, scales down to at most
+    max_pixels, center-crops to multiples of 64 and re-encodes.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            image = ImageOps.exif_transpose(image)
+    except Exception as e:
+        raise ValueError("The attached file is not a valid image") from e
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    width, height = image.size
+    scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+    target = (
+        max(DIMENSION_MULTIPLE, int(width * scale) // DIMENSION_MULTIPLE * DIMENSION_MULTIPLE),
+        max(DIMENSION_MULTIPLE, int(height * scale) // DIMENSION_MULTIPLE * DIMENSION_MULTIPLE)
+    )
+    if target != image.size:
+        image = ImageOps.fit(image, target, Image.LANCZOS)
+
+    # JPEG has no alpha channel; keep transparent inputs lossless
+    if image_format == 'jpeg' and image.mode == 'RGBA':
+        image_format = 'png'
+    return _encode(image, image_format, quality), image_format
+
+
+def make_preview(data: bytes, max_size: int) -> bytes:
+    """Shrink a live preview frame to a small JPEG. Runs in a worker process."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((max_size, max_size))
+        return _encode(image, 'jpeg', 80)
+
+
+def _read_and_close(images: List[BinaryIO]) -> List[bytes]:
+    data = []
+    for image in images:
+        try:
+            image.seek(0)
+            data.append(image.read())
+        finally:
+            image.close()
+    return data
+
+
+def total_size(images: List[BinaryIO]) -> int:
+    """Combined size in bytes of seekable file objects, leaving each rewound."""
+    size = 0
+    for image in images:
+        size += image.seek(0, io.SEEK_END)
+        image.seek(0)
+    return size
+
+
+class ImageProcessor:
+    """Runs Pillow work in a process pool so it never blocks the event loop.
+
+    Outputs are re-encoded to the configured format and quality (optionally
+    tiled into one grid) and shrunk as needed to stay under the upload
+    limit. Inputs are validated, stripped and resized before upload.
+    """
+
+    def __init__(
+        self,
+        output_format: str = 'webp',
+        output_quality: int = 90,
+        grid: bool = False,
+        input_max_pixels: int = 1024 * 1024,
+        input_format: str = 'jpeg',
+        input_quality: int = 95,
+        workers: int = 2
+    ):
+        for image_format in (output_format, input_format):
+            if image_format not in EXTENSIONS:
+                raise ValueError(f"Unsupported image format: {image_format}")
+        self.output_format = output_format
+        self.output_quality = output_quality
+        self.grid = grid
+        self.input_max_pixels = input_max_pixels
+        self.input_format = input_format
+        self.input_quality = input_quality
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        if self._executor is None:
+            # Forking would copy locks held by the event loop's helper threads into the workers
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def warm_up(self):
+        """Start the worker processes and load Pillow in them before the first job needs it."""
+        await asyncio.gather(*(self._run(_load_pillow) for _ in range(self.workers)))
+
+    async def _run(self, func, *args):
+        self.start()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def prepare_input(self, data: bytes, filename: str) -> Tuple[bytes, str]:
+        """Return the normalized input image and a filename matching its new format."""
+        encoded, image_format = await self._run(
+            preprocess_input, data, self.input_max_pixels, self.input_format, self.input_quality
+        )
+        stem = filename.rsplit('.', 1)[0] or 'input'
+        return encoded, f"{stem}{EXTENSIONS[image_format]}"
+
+    async def prepare_preview(self, data: bytes, max_size: int = 512) -> bytes:
+        """Return a small JPEG of a live preview frame."""
+        return await self._run(make_preview, data, max_size)
+
+    async def prepare_outputs(self, images: List[BinaryIO], max_bytes: int = DEFAULT_UPLOAD_LIMIT) -> List[Tuple[BinaryIO, str]]:
+        """Return (file, extension) pairs ready to attach.
+
+        Takes ownership of the given file objects.
+        """
+        if not images:
+            return []
+
+        # Leave room for the embed and multipart overhead
+        budget = int(max_bytes * 0.95)
+
+        # Untouched PNGs already fit: skip the round trip through the pool
+        if self.output_format == 'png' and not self.grid:
+            if await asyncio.to_thread(total_size, images) <= budget:
+                return [(image, '.png') for image in images]
+
+        data = await asyncio.to_thread(_read_and_close, images)
+
+        if self.grid and len(data) > 1:
+            jobs = [self._run(build_grid, data, self.output_format, self.output_quality, budget)]
+        else:
+            per_image = budget // len(data)
+            jobs = [
+                self._run(transcode_image, image, self.output_format, self.output_quality, per_image)
+                for image in data
+            ]
+
+        results = await asyncio.gather(*jobs)
+        return [(io.BytesIO(encoded), EXTENSIONS[image_format]) for encoded, image_format in results]
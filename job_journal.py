@@ -0,0 +1,104 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Optional, Dict, Any, List
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger('job_journal')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    user_id INTEGER NOT NULL,
+    guild_id INTEGER,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER,
+    backend TEXT,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prompts (
+    prompt_id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL REFERENCES jobs(job_id) ON DELETE CASCADE,
+    backend TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS prompts_job ON prompts(job_id);
+"""
+
+# Job states kept in the journal; finished jobs are deleted
+QUEUED = 'queued'
+RUNNING = 'running'
+
+
+class JobJournal(SQLiteStore):
+    """SQLite journal of the jobs that have not finished yet.
+
+    A job is written when it is accepted, gets its ComfyUI prompt ids as
+    they are queued and is deleted once its result has been delivered. What
+    is left after a restart is the work that was interrupted: queued jobs
+    never reached ComfyUI, running jobs can be picked up from /history.
+
+    Failed writes are logged, not raised: losing the journal must not
+    fail the job itself.
+    """
+
+    schema = SCHEMA
+
+    async def _write(self, func, *args):
+        try:
+            await asyncio.to_thread(func, *args)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write job journal: {e}")
+
+    async def add(self, job_id: str, user_id: int, guild_id: Optional[int], channel_id: int, params: Dict[str, Any]):
+        """Record a newly accepted job."""
+        await self._write(
+            self._execute,
+            'INSERT INTO jobs (job_id, created, user_id, guild_id, channel_id, params, state) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, time.time(), user_id, guild_id, channel_id, json.dumps(params), QUEUED)
+        )
+
+    async def set_message(self, job_id: str, message_id: int, params: Dict[str, Any]):
+        """Remember the status message, so late results can reply to it, and the final parameters."""
+        await self._write(
+            self._execute,
+            'UPDATE jobs SET message_id = ?, params = ? WHERE job_id = ?',
+            (message_id, json.dumps(params), job_id)
+        )
+
+    async def add_prompt(self, job_id: str, prompt_id: str, backend: str):
+        """Record a prompt queued on ComfyUI for a job; the job is now running."""
+        def write():
+            with self._lock:
+                with self._db:
+                    self._db.execute('BEGIN')
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO prompts (prompt_id, job_id, backend) VALUES (?, ?, ?)',
+                        (prompt_id, job_id, backend)
+                    )
+                    self._db.execute(
+                        'UPDATE jobs SET state = ?, backend = ? WHERE job_id = ?',
+                        (RUNNING, backend, job_id)
+                    )
+        await self._write(write)
+
+    async def finish(self, job_id: str):
+        """Forget a job whose outcome has been delivered (or that can't be recovered)."""
+        await self._write(self._execute, 'DELETE FROM jobs WHERE job_id = ?', (job_id,))
+
+    async def unfinished(self) -> List[Dict[str, Any]]:
+        """Every job left in the journal, oldest first, with its prompt ids in queue order."""
+        def read():
+            jobs = [dict(row) for row in self._execute('SELECT * FROM jobs ORDER BY created')]
+            for job in jobs:
+                job['params'] = json.loads(job['params'])
+                job['prompts'] = [
+                    (row['prompt_id'], row['backend'])
+                    for row in self._execute('SELECT prompt_id, backend FROM prompts WHERE job_id = ? ORDER BY rowid', (job['job_id'],))
+                ]
+            return jobs
+        return await asyncio.to_thread(read)
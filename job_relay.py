@@ -0,0 +1,335 @@
+import asyncio
+import io
+import itertools
+import logging
+import sqlite3
+import time
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+
+import aiohttp
+import discord
+
+from shared_queue import SharedQueue, DONE
+
+logger = logging.getLogger('job_relay')
+
+# Interaction tokens expire after 15 minutes; events and interactions older than that are useless
+INTERACTION_LIFETIME = 15 * 60
+
+# Seconds between the dispatcher's snapshots of catalog options, server status and stats
+PUBLISH_INTERVAL = 10.0
+
+# Event kinds
+SEND = 'send'
+EDIT = 'edit'
+EDIT_ORIGINAL = 'edit_original'
+REJECT = 'reject'
+
+
+def _read_files(files: Optional[List[discord.File]]) -> List[Tuple[str, bytes]]:
+    contents = []
+    for file in files or []:
+        file.reset()
+        contents.append((file.filename, file.fp.read()))
+        file.close()
+    return contents
+
+
+class RemoteAttachment:
+    """Stands in for a discord.Attachment; downloads it from Discord's CDN."""
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, filename: str):
+        self._session = session
+        self.url = url
+        self.filename = filename
+
+    async def read(self) -> bytes:
+        async with self._session.get(self.url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+
+class RemoteUser:
+    def __init__(self, user_id: int, display_name: str):
+        self.id = user_id
+        self.display_name = display_name
+
+    def __str__(self) -> str:
+        return self.display_name
+
+
+class RemoteGuild:
+    def __init__(self, filesize_limit: int):
+        self.filesize_limit = filesize_limit
+
+
+class RemoteMessage:
+    """A followup message sent through the frontend, identified by a per-job key."""
+
+    def __init__(self, interaction: 'RemoteInteraction', key: int):
+        self._interaction = interaction
+        self.id = key
+
+    async def edit(self, *, content: Optional[str] = None, attachments=discord.utils.MISSING):
+        replace = attachments is not discord.utils.MISSING
+        await self._interaction.emit(
+            EDIT, {'key': self.id, 'content': content, 'attachments': replace},
+            _read_files(attachments) if replace else ()
+        )
+
+
+class RemoteFollowup:
+    def __init__(self, interaction: 'RemoteInteraction'):
+        self._interaction = interaction
+
+    async def send(
+        self,
+        content: Optional[str] = None,
+        *,
+        embed: Optional[discord.Embed] = None,
+        files: Optional[List[discord.File]] = None,
+        wait: bool = False
+    ) -> Optional[RemoteMessage]:
+        key = next(self._interaction.keys)
+        await self._interaction.emit(
+            SEND, {'key': key, 'content': content, 'embed': embed.to_dict() if embed is not None else None},
+            _read_files(files)
+        )
+        return RemoteMessage(self._interaction, key) if wait else None
+
+
+class RemoteInteraction:
+    """Stands in for the discord.Interaction of a job in the dispatcher.
+
+    Provides the parts run_generation and ProgressReporter use. Every
+    message sent or edited becomes an event for the frontend that owns
+    the real interaction, which replays it on Discord in order.
+    """
+
+    def __init__(self, queue: SharedQueue, job: Dict[str, Any], session: aiohttp.ClientSession):
+        self.queue = queue
+        self.job = job
+        self.keys = itertools.count(1)
+        self.user = RemoteUser(job['user_id'], job['user_name'])
+        self.guild = RemoteGuild(job['filesize_limit']) if job['filesize_limit'] is not None else None
+        self.followup = RemoteFollowup(self)
+        attachment = job['params'].get('attachment')
+        self.attachment = RemoteAttachment(session, attachment['url'], attachment['filename']) if attachment else None
+
+    async def edit_original_response(self, *, content: Optional[str] = None):
+        await self.emit(EDIT_ORIGINAL, {'content': content})
+
+    async def reject(self, content: str):
+        """Turn the job down after all; the frontend refunds its charge and tells the user privately."""
+        await self.emit(REJECT, {'content': content})
+
+    async def emit(self, kind: str, payload: Dict[str, Any], files=()):
+        await self.queue.emit(self.job, kind, payload, files)
+
+
+class Dispatcher:
+    """Runs the jobs frontends put in the shared queue.
+
+    Claims queued jobs and hands each to run with a RemoteInteraction,
+    forwards /cancel requests to cancel, and publishes state() for the
+    frontends every PUBLISH_INTERVAL seconds. Jobs a previous dispatcher
+    left running are reported as failed on start, since their progress
+    went with it.
+    """
+
+    def __init__(
+        self,
+        queue: SharedQueue,
+        run: Callable[[RemoteInteraction, Dict[str, Any]], Awaitable[None]],
+        cancel: Callable[[int], int],
+        state: Callable[[], Dict[str, Any]],
+        poll_interval: float = 0.25
+    ):
+        self.queue = queue
+        self.run = run
+        self.cancel = cancel
+        self.state = state
+        self.poll_interval = poll_interval
+        self.closing = False
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._jobs: set[asyncio.Task] = set()
+
+    async def start(self):
+        self._session = aiohttp.ClientSession()
+        for job in await self.queue.take_interrupted():
+            interaction = RemoteInteraction(self.queue, job, self._session)
+            await interaction.followup.send(
+                "⚠️ The bot restarted while your generation was running. Please run `/generate` again."
+            )
+            await self.queue.finish(job)
+        self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def close(self):
+        self.closing = True
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+        for task in self._jobs:
+            task.cancel()
+        await asyncio.gather(*self._jobs, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+
+    async def _poll_loop(self):
+        last_publish = last_prune = 0.0
+        while True:
+            try:
+                for job in await self.queue.claim():
+                    task = asyncio.create_task(self._run_job(job))
+                    self._jobs.add(task)
+                    task.add_done_callback(self._jobs.discard)
+                for user_id in await self.queue.take_cancellations():
+                    self.cancel(user_id)
+                now = time.monotonic()
+                if now - last_publish >= PUBLISH_INTERVAL:
+                    await self.queue.publish(self.state())
+                    last_publish = now
+                if now - last_prune >= INTERACTION_LIFETIME / 3:
+                    await self.queue.prune(INTERACTION_LIFETIME)
+                    last_prune = now
+            except sqlite3.Error as e:
+                logger.warning(f"Shared queue unavailable: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _run_job(self, job: Dict[str, Any]):
+        try:
+            await self.run(RemoteInteraction(self.queue, job, self._session), job)
+        except Exception as e:
+            logger.error(f"Job {job['job_id']} failed: {e}", exc_info=True)
+        finally:
+            # Jobs still running at shutdown stay claimed, so the next start reports them
+            if not self.closing:
+                await self.queue.finish(job)
+
+
+class InteractionRelay:
+    """Replays the dispatcher's events for this frontend on the real interactions.
+
+    Each job's events run in order on its own task, so one slow upload
+    doesn't hold up other jobs' progress. Interactions and their tasks are
+    forgotten when their job is done or when their token has expired.
+    """
+
+    def __init__(self, queue: SharedQueue, frontend: str, poll_interval: float = 0.25):
+        self.queue = queue
+        self.frontend = frontend
+        self.poll_interval = poll_interval
+        # job_id -> (interaction, registered at, followup messages by key, called if the job is rejected)
+        self._interactions: Dict[
+            str, Tuple[discord.Interaction, float, Dict[int, discord.WebhookMessage], Optional[Callable[[], None]]]
+        ] = {}
+        self._pending: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._poll_task: Optional[asyncio.Task] = None
+
+    def register(
+        self,
+        job_id: str,
+        interaction: discord.Interaction,
+        on_reject: Optional[Callable[[], None]] = None
+    ):
+        """Relay a job's events to this interaction. Register before queueing, so no event comes first."""
+        self._interactions[job_id] = (interaction, time.monotonic(), {}, on_reject)
+
+    def unregister(self, job_id: str):
+        """Forget a job that never made it into the queue."""
+        self._interactions.pop(job_id, None)
+
+    def start(self):
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def close(self):
+        tasks = [task for task in [self._poll_task, *self._workers.values()] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._poll_task = None
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                events = await self.queue.take_events(self.frontend)
+            except sqlite3.Error as e:
+                logger.warning(f"Shared queue unavailable: {e}")
+                events = []
+            for event in events:
+                job_id = event['job_id']
+                if job_id not in self._interactions:
+                    if event['kind'] != DONE:
+                        logger.debug(f"Dropping {event['kind']} event for unknown job {job_id}")
+                    continue
+                if job_id not in self._pending:
+                    self._pending[job_id] = asyncio.Queue()
+                    self._workers[job_id] = asyncio.create_task(self._replay(job_id))
+                self._pending[job_id].put_nowait(event)
+            self._expire()
+            if not events:
+                await asyncio.sleep(self.poll_interval)
+
+    def _expire(self):
+        deadline = time.monotonic() - INTERACTION_LIFETIME
+        for job_id in [job_id for job_id, (_, registered, _, _) in self._interactions.items() if registered < deadline]:
+            if job_id not in self._workers:
+                del self._interactions[job_id]
+
+    async def _replay(self, job_id: str):
+        interaction, registered, messages, on_reject = self._interactions[job_id]
+        pending = self._pending[job_id]
+        try:
+            while True:
+                # Stop with the interaction's token, in case DONE was pruned or never sent
+                try:
+                    event = await asyncio.wait_for(
+                        pending.get(), max(0.0, registered + INTERACTION_LIFETIME - time.monotonic())
+                    )
+                except asyncio.TimeoutError:
+                    logger.debug(f"Interaction for job {job_id} expired before the job finished")
+                    return
+                if event['kind'] == DONE:
+                    return
+                if event['kind'] == REJECT and on_reject is not None:
+                    on_reject()
+                try:
+                    await self._apply(interaction, messages, event)
+                except discord.HTTPException as e:
+                    logger.warning(f"Failed to relay {event['kind']} for job {job_id}: {e}")
+        finally:
+            del self._interactions[job_id], self._pending[job_id], self._workers[job_id]
+
+    @staticmethod
+    async def _apply(
+        interaction: discord.Interaction,
+        messages: Dict[int, discord.WebhookMessage],
+        event: Dict[str, Any]
+    ):
+        payload = event['payload']
+        files = [discord.File(io.BytesIO(data), filename=filename) for filename, data in event['files']]
+        if event['kind'] == SEND:
+            kwargs = {}
+            if payload['content'] is not None:
+                kwargs['content'] = payload['content']
+            if payload['embed'] is not None:
+                kwargs['embed'] = discord.Embed.from_dict(payload['embed'])
+            if files:
+                kwargs['files'] = files
+            messages[payload['key']] = await interaction.followup.send(wait=True, **kwargs)
+        elif event['kind'] == EDIT:
+            message = messages.get(payload['key'])
+            if message is None:
+                return
+            if payload['attachments']:
+                await message.edit(content=payload['content'], attachments=files)
+            else:
+                await message.edit(content=payload['content'])
+        elif event['kind'] == EDIT_ORIGINAL:
+            await interaction.edit_original_response(content=payload['content'])
+        elif event['kind'] == REJECT:
+            # Replace the public "thinking" placeholder with a message only the user sees
+            await interaction.delete_original_response()
+            await interaction.followup.send(payload['content'], ephemeral=True)
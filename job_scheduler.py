@@ -0,0 +1,268 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, Callable, Awaitable, Hashable, List, Set, Collection
+
+logger = logging.getLogger('job_scheduler')
+
+
+class QueueFullError(Exception):
+    """Raised when a job cannot be admitted because a queue is full."""
+
+
+class ScheduledJob:
+    """A unit of work waiting in or running from the scheduler."""
+
+    def __init__(
+        self,
+        user_id: Hashable,
+        guild_id: Hashable,
+        run: Callable[[], Awaitable[Any]],
+        on_position: Optional[Callable[[int, int], Awaitable[None]]] = None,
+        model: Optional[str] = None
+    ):
+        self.user_id = user_id
+        self.guild_id = guild_id
+        self.run = run
+        self.on_position = on_position
+        self.model = model
+        # Times a job with an already loaded model was dispatched ahead of this one
+        self.skips = 0
+        self.position: Optional[int] = None
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.task: Optional[asyncio.Task] = None
+
+    def __await__(self):
+        return self.future.__await__()
+
+
+class JobScheduler:
+    """Fair bot-side queue in front of ComfyUI.
+
+    Pending jobs are kept per guild and per user. Dispatch alternates
+    round-robin between guilds and, inside a guild, between users, so one
+    user firing many commands cannot starve everyone else. At most
+    max_concurrent jobs run at once.
+
+    Swapping checkpoints costs ComfyUI seconds of loading, so when
+    loaded_models() is given, a pending job whose model is already loaded
+    may be dispatched ahead of the fair pick. A job is passed over like
+    this at most max_model_skips times.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 2,
+        max_queue_depth: int = 50,
+        max_user_jobs: int = 3,
+        max_guild_jobs: int = 20,
+        loaded_models: Optional[Callable[[], Collection[str]]] = None,
+        max_model_skips: int = 4
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self.max_user_jobs = max_user_jobs
+        self.max_guild_jobs = max_guild_jobs
+        self.loaded_models = loaded_models
+        self.max_model_skips = max_model_skips
+        # guild_id -> user_id -> pending jobs, both in round-robin order
+        self._queues: "OrderedDict[Hashable, OrderedDict[Hashable, deque]]" = OrderedDict()
+        self._pending = 0
+        self._running = 0
+        self._user_jobs: Dict[Hashable, int] = {}
+        self._guild_jobs: Dict[Hashable, int] = {}
+        self._active: Set[ScheduledJob] = set()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def check_admission(self, user_id: Hashable, guild_id: Hashable):
+        """Raise QueueFullError if a new job from this user would be rejected."""
+        self.check_counts(self._pending, self._user_jobs.get(user_id, 0), self._guild_jobs.get(guild_id, 0))
+
+    def check_counts(self, pending: int, user_jobs: int, guild_jobs: int):
+        """Raise QueueFullError if a new job would be rejected with these numbers of jobs already in.
+
+        pending counts waiting jobs; user_jobs and guild_jobs count the
+        user's and the guild's jobs, queued or running. Lets a process that
+        doesn't run the jobs itself apply the same limits.
+        """
+        if pending >= self.max_queue_depth:
+            raise QueueFullError(f"The queue is full ({self.max_queue_depth} jobs waiting), please try again later.")
+        if user_jobs >= self.max_user_jobs:
+            raise QueueFullError(f"You already have {self.max_user_jobs} job(s) queued or running.")
+        if guild_jobs >= self.max_guild_jobs:
+            raise QueueFullError(f"This server already has {self.max_guild_jobs} job(s) queued or running.")
+
+    def submit(
+        self,
+        user_id: Hashable,
+        guild_id: Hashable,
+        run: Callable[[], Awaitable[Any]],
+        on_position: Optional[Callable[[int, int], Awaitable[None]]] = None,
+        model: Optional[str] = None
+    ) -> ScheduledJob:
+        """Queue a job. Await the returned job for the result of run().
+
+        model is the checkpoint the job needs, used to avoid model swaps.
+        """
+        self.check_admission(user_id, guild_id)
+
+        job = ScheduledJob(user_id, guild_id, run, on_position, model)
+        users = self._queues.setdefault(guild_id, OrderedDict())
+        users.setdefault(user_id, deque()).append(job)
+        self._pending += 1
+        self._user_jobs[user_id] = self._user_jobs.get(user_id, 0) + 1
+        self._guild_jobs[guild_id] = self._guild_jobs.get(guild_id, 0) + 1
+
+        self._dispatch()
+        return job
+
+    def cancel(self, user_id: Hashable) -> int:
+        """Cancel every queued and running job of a user. Returns how many were cancelled.
+
+        Waiters of a cancelled job get asyncio.CancelledError.
+        """
+        cancelled = 0
+        for guild_id, users in list(self._queues.items()):
+            jobs = users.pop(user_id, None)
+            if not jobs:
+                continue
+            if not users:
+                del self._queues[guild_id]
+            for job in jobs:
+                job.future.cancel()
+                self._pending -= 1
+                self._release(user_id, self._user_jobs)
+                self._release(guild_id, self._guild_jobs)
+                cancelled += 1
+
+        for job in self._active:
+            if job.user_id == user_id and job.task is not None and not job.task.done():
+                job.task.cancel()  # Slot and counts are released when the task unwinds
+                cancelled += 1
+
+        if cancelled:
+            self._notify_positions()
+        return cancelled
+
+    def _next_job(self) -> ScheduledJob:
+        fair = self._fair_job()
+        if self.loaded_models is None or fair.skips >= self.max_model_skips:
+            return self._take_fair()
+
+        loaded = self.loaded_models()
+        if fair.model is None or fair.model in loaded:
+            return self._take_fair()
+
+        # Run a job for a model that is already loaded instead, if there is one
+        for job in self._dispatch_order():
+            if job.model is not None and job.model in loaded:
+                fair.skips += 1
+                self._take(job)
+                return job
+        return self._take_fair()
+
+    def _fair_job(self) -> ScheduledJob:
+        users = next(iter(self._queues.values()))
+        return next(iter(users.values()))[0]
+
+    def _take(self, job: ScheduledJob):
+        """Remove a job from the middle of the queues without rotating them."""
+        users = self._queues[job.guild_id]
+        jobs = users[job.user_id]
+        jobs.remove(job)
+        if not jobs:
+            del users[job.user_id]
+        if not users:
+            del self._queues[job.guild_id]
+
+    def _take_fair(self) -> ScheduledJob:
+        guild_id, users = next(iter(self._queues.items()))
+        user_id, jobs = next(iter(users.items()))
+        job = jobs.popleft()
+
+        # Rotate so the next pick comes from another user and guild
+        if jobs:
+            users.move_to_end(user_id)
+        else:
+            del users[user_id]
+        if users:
+            self._queues.move_to_end(guild_id)
+        else:
+            del self._queues[guild_id]
+        return job
+
+    def _dispatch_order(self) -> List[ScheduledJob]:
+        """Pending jobs in the order they will be dispatched."""
+        guilds = deque(
+            deque(deque(jobs) for jobs in users.values())
+            for users in self._queues.values()
+        )
+        order = []
+        while guilds:
+            users = guilds.popleft()
+            jobs = users.popleft()
+            order.append(jobs.popleft())
+            if jobs:
+                users.append(jobs)
+            if users:
+                guilds.append(users)
+        return order
+
+    def _dispatch(self):
+        while self._running < self.max_concurrent and self._pending:
+            job = self._next_job()
+            self._pending -= 1
+            self._running += 1
+            job.position = 0
+            self._active.add(job)
+            job.task = asyncio.create_task(self._run(job))
+        self._notify_positions()
+
+    def _notify_positions(self):
+        order = self._dispatch_order()
+        total = len(order)
+        for position, job in enumerate(order, start=1):
+            if job.position != position:
+                job.position = position
+                if job.on_position is not None:
+                    asyncio.create_task(self._call_position(job, position, total))
+
+    async def _call_position(self, job: ScheduledJob, position: int, total: int):
+        if job.position != position:
+            return  # Superseded by a newer update before this one ran
+        try:
+            await job.on_position(position, total)
+        except Exception as e:
+            logger.warning(f"Failed to report queue position: {e}")
+
+    async def _run(self, job: ScheduledJob):
+        try:
+            result = await job.run()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._running -= 1
+            self._active.discard(job)
+            self._release(job.user_id, self._user_jobs)
+            self._release(job.guild_id, self._guild_jobs)
+            self._dispatch()
+
+    @staticmethod
+    def _release(key: Hashable, counts: Dict[Hashable, int]):
+        counts[key] -= 1
+        if counts[key] <= 0:
+            del counts[key]
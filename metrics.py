@@ -0,0 +1,207 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Tuple, List, Iterator
+
+from aiohttp import web
+
+logger = logging.getLogger('metrics')
+
+# Upper bounds in seconds; covers fast HTTP calls up to long GPU runs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _quantile(buckets: Tuple[float, ...], counts: List[int], q: float) -> Optional[float]:
+    """Estimate a quantile from bucket counts by interpolating inside its bucket."""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for idx, bucket_count in enumerate(counts):
+        if bucket_count and cumulative + bucket_count >= rank:
+            if idx == len(buckets):
+                return buckets[-1]
+            lower = buckets[idx - 1] if idx else 0.0
+            return lower + (buckets[idx] - lower) * (rank - cumulative) / bucket_count
+        cumulative += bucket_count
+    return buckets[-1]
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram with labels. Observing is a bisect and two adds."""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def quantile(self, q: float, *label_values: str) -> Optional[float]:
+        series = self.series.get(label_values)
+        return _quantile(self.buckets, series[0], q) if series else None
+
+    def merged(self, label: str, value: str) -> Tuple[List[int], float]:
+        """Bucket counts and sum over every series where the given label has this value."""
+        position = self.labels.index(label)
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for label_values, (series_counts, series_sum) in self.series.items():
+            if label_values[position] == value:
+                counts = [a + b for a, b in zip(counts, series_counts)]
+                total += series_sum
+        return counts, total
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+# Time spent in each stage of a /generate job, per ComfyUI backend
+STAGE_SECONDS = Histogram(
+    'comfybot_stage_seconds',
+    'Time spent in each stage of a generation job',
+    labels=('stage', 'backend')
+)
+
+# Finished jobs per backend and result (success, failure, timeout, cancelled)
+JOBS = Counter(
+    'comfybot_jobs_total',
+    'Generation jobs by backend and result',
+    labels=('backend', 'result')
+)
+
+STAGES = (
+    'attachment_read', 'preprocess', 'upload', 'queue_prompt', 'queue_wait',
+    'execution', 'history', 'download', 'encode', 'discord_send', 'total'
+)
+
+
+def stage(name: str, backend: str = ''):
+    """Context manager that times one stage of a job."""
+    return STAGE_SECONDS.time(name, backend)
+
+
+def stage_summary() -> List[Tuple[str, int, Optional[float], Optional[float], float]]:
+    """(stage, count, p50, p95, mean) for every stage seen so far, across all backends."""
+    summary = []
+    for name in STAGES:
+        counts, total = STAGE_SECONDS.merged('stage', name)
+        count = sum(counts)
+        if count:
+            summary.append((
+                name, count,
+                _quantile(STAGE_SECONDS.buckets, counts, 0.5),
+                _quantile(STAGE_SECONDS.buckets, counts, 0.95),
+                total / count
+            ))
+    return summary
+
+
+def job_summary() -> Dict[str, Dict[str, int]]:
+    """Finished jobs per backend, by result."""
+    summary: Dict[str, Dict[str, int]] = {}
+    for (backend, result), value in JOBS.values.items():
+        summary.setdefault(backend, {})[result] = int(value)
+    return summary
+
+
+def render() -> str:
+    return '\n'.join(STAGE_SECONDS.render() + JOBS.render()) + '\n'
+
+
+class MetricsServer:
+    """Serves the metrics in Prometheus text format on /metrics."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 9108):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def serving(self) -> bool:
+        return self._runner is not None
+
+    async def start(self):
+        """Start serving. If the port can't be bound, log a warning and carry on without metrics."""
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            logger.warning(f"Metrics endpoint disabled, cannot listen on {self.host}:{self.port}: {e}")
+            await self.close()
+            return
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type='text/plain', charset='utf-8')
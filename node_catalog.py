@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any, List, Callable, Awaitable, FrozenSet, Tuple
+
+from workflow_templates import WorkflowTemplate
+
+logger = logging.getLogger('node_catalog')
+
+# Seconds to wait before retrying a failed /object_info fetch
+RETRY_INTERVAL = 30.0
+
+
+class WorkflowValidationError(ValueError):
+    """Raised when a workflow's parameters don't match what the ComfyUI server accepts."""
+
+
+class NodeCatalog:
+    """The node types and input specs of one ComfyUI server, from /object_info.
+
+    Inputs are looked up by (class_type, input name). Combo inputs are
+    checked against a frozenset of their options, numbers against their
+    min and max, so validating a request is a handful of dict lookups.
+    """
+
+    def __init__(self, object_info: Dict[str, Any]):
+        # class_type -> input name -> (type, options)
+        self._inputs: Dict[str, Dict[str, Tuple[Any, Dict[str, Any]]]] = {}
+        self._options: Dict[Tuple[str, str], List[str]] = {}
+        self._option_sets: Dict[Tuple[str, str], FrozenSet[str]] = {}
+        for class_type, node in object_info.items():
+            inputs = {}
+            for section in ('required', 'optional'):
+                for name, spec in ((node.get('input') or {}).get(section) or {}).items():
+                    if not isinstance(spec, (list, tuple)) or not spec:
+                        continue
+                    input_type = spec[0]
+                    options = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+                    inputs[name] = (input_type, options)
+                    # Older servers send combo options as the type itself, newer ones as COMBO + options
+                    if isinstance(input_type, list):
+                        choices = input_type
+                    elif input_type == 'COMBO':
+                        choices = options.get('options') or []
+                    else:
+                        continue
+                    choices = [str(choice) for choice in choices]
+                    self._options[class_type, name] = choices
+                    self._option_sets[class_type, name] = frozenset(choices)
+            self._inputs[class_type] = inputs
+
+    def __contains__(self, class_type: str) -> bool:
+        return class_type in self._inputs
+
+    def __len__(self) -> int:
+        return len(self._inputs)
+
+    def options(self, class_type: str, input_name: str) -> List[str]:
+        """The values a combo input accepts, e.g. KSampler's sampler_name."""
+        return self._options.get((class_type, input_name), [])
+
+    def validate(self, template: WorkflowTemplate, params: Dict[str, Any]):
+        """Raise WorkflowValidationError if the server would reject these parameters.
+
+        Only parameters present in params are checked, so a request can be
+        checked before its defaults have been filled in.
+        """
+        nodes = template.workflow
+        for node in nodes.values():
+            if node.get('class_type') not in self._inputs:
+                raise WorkflowValidationError(f"The ComfyUI server has no {node.get('class_type')} node")
+
+        for slot, paths in template.slots.items():
+            if slot not in params:
+                continue
+            value = params[slot]
+            for path in paths:
+                if len(path) != 3 or path[1] != 'inputs':
+                    continue
+                class_type = nodes[path[0]]['class_type']
+                spec = self._inputs[class_type].get(path[2])
+                if spec is not None:
+                    self._check(class_type, path[2], spec, value)
+
+    def _check(self, class_type: str, input_name: str, spec: Tuple[Any, Dict[str, Any]], value: Any):
+        input_type, options = spec
+        choices = self._option_sets.get((class_type, input_name))
+        if options.get('image_upload'):
+            # Lists the files at the last fetch; images the bot has just uploaded aren't in it yet
+            return
+        if choices is not None:
+            if str(value) not in choices:
+                raise WorkflowValidationError(f"{value} is not a valid {input_name} on this ComfyUI server")
+        elif input_type in ('INT', 'FLOAT'):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise WorkflowValidationError(f"{input_name} must be a number")
+            if input_type == 'INT' and not isinstance(value, int):
+                raise WorkflowValidationError(f"{input_name} must be a whole number")
+            low, high = options.get('min'), options.get('max')
+            if low is not None and value < low:
+                raise WorkflowValidationError(f"{input_name} must be at least {low:g}")
+            if high is not None and value > high:
+                raise WorkflowValidationError(f"{input_name} must be at most {high:g}")
+
+
+class NodeCatalogCache:
+    """Keeps a ComfyUI server's NodeCatalog fresh in the background.
+
+    /object_info is large, so it is fetched once and refetched every ttl
+    seconds by a background task; readers never wait for it. Until the
+    first fetch succeeds catalog is None. A failed refresh keeps the old
+    catalog and is retried sooner.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[Dict[str, Any]]], ttl: float = 600.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.catalog: Optional[NodeCatalog] = None
+        self.fetched_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+
+    def start(self):
+        """Start the background refresh task if it is not running."""
+        if self._ready is None:
+            self._ready = asyncio.Event()
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the first fetch has succeeded. Returns False on timeout."""
+        self.start()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def refresh(self):
+        """Fetch /object_info now and replace the catalog."""
+        object_info = await self.fetch()
+        # Indexing thousands of node specs would stall the event loop
+        self.catalog = await asyncio.to_thread(NodeCatalog, object_info)
+        self.fetched_at = time.monotonic()
+        if self._ready is not None:
+            self._ready.set()
+
+    async def _refresh_loop(self):
+        while True:
+            if self.fetched_at is None or time.monotonic() - self.fetched_at >= self.ttl:
+                try:
+                    await self.refresh()
+                    logger.info(f"Loaded {len(self.catalog)} ComfyUI node types")
+                except Exception as e:
+                    logger.warning(f"Failed to fetch ComfyUI node catalog: {e}")
+                    await asyncio.sleep(min(self.ttl, RETRY_INTERVAL))
+                    continue
+            await asyncio.sleep(max(0.0, self.fetched_at + self.ttl - time.monotonic()))
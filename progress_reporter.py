@@ -0,0 +1,101 @@
+import asyncio
+import io
+import logging
+from typing import Optional, Dict, Any, Tuple
+
+import discord
+
+from image_processing import ImageProcessor
+
+logger = logging.getLogger('progress_reporter')
+
+BAR_LENGTH = 12
+
+
+class ProgressReporter:
+    """Shows live sampling progress and previews by editing one message.
+
+    Events only record the latest state. A background task turns that state
+    into at most one message edit per interval, so bursts of progress events
+    are coalesced and Discord's edit rate limits are respected.
+    """
+
+    def __init__(
+        self,
+        message: discord.WebhookMessage,
+        text: str,
+        image_processor: ImageProcessor,
+        interval: float = 2.0,
+        previews: bool = True,
+        total_steps: int = 0
+    ):
+        self.message = message
+        self.text = text
+        self.image_processor = image_processor
+        self.interval = interval
+        self.previews = previews
+        # Steps across all prompts of the job, so the bar doesn't jump back when a new chunk starts
+        self.total_steps = total_steps
+        self._progress: Dict[str, Tuple[int, int]] = {}
+        self._preview: Optional[bytes] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self, text: Optional[str] = None):
+        """Stop updating; optionally replace the message with a final text."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if text is not None:
+            try:
+                await self.message.edit(content=text, attachments=[])
+            except discord.HTTPException as e:
+                logger.warning(f"Failed to finalize progress message: {e}")
+
+    def on_event(self, event_type: str, data: Dict[str, Any]):
+        """Event listener for ComfyUIClient.wait_for_completion. Never blocks."""
+        if event_type == 'progress':
+            self._progress[data['prompt_id']] = (data.get('value', 0), data.get('max', 0))
+        elif event_type == 'preview' and self.previews:
+            self._preview = data['image']
+        else:
+            return
+        if self._changed is not None:
+            self._changed.set()
+
+    def _render_text(self) -> str:
+        value = sum(value for value, _ in self._progress.values())
+        maximum = max(self.total_steps, sum(maximum for _, maximum in self._progress.values()))
+        if not maximum:
+            return self.text
+        filled = round(BAR_LENGTH * value / maximum)
+        bar = '█' * filled + '░' * (BAR_LENGTH - filled)
+        return f"{self.text}\n`{bar}` {100 * value // maximum}%"
+
+    async def _run(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+
+            preview, self._preview = self._preview, None
+            attachments = discord.utils.MISSING
+            if preview is not None:
+                try:
+                    preview = await self.image_processor.prepare_preview(preview)
+                    attachments = [discord.File(io.BytesIO(preview), filename="preview.jpg")]
+                except Exception as e:
+                    logger.warning(f"Failed to decode preview: {e}")
+
+            try:
+                await self.message.edit(content=self._render_text(), attachments=attachments)
+            except discord.HTTPException as e:
+                logger.warning(f"Failed to update progress message: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,134 @@
+import time
+from typing import Optional, Dict, Hashable
+
+# A 20-step 512x512 image costs 1; everything else scales linearly from it
+REFERENCE_STEPS = 20
+REFERENCE_PIXELS = 512 * 512
+
+# No job is free: a single step of a reference image
+MIN_JOB_COST = 1 / REFERENCE_STEPS
+
+# Seconds between sweeps that forget buckets which have refilled completely
+PRUNE_INTERVAL = 600
+
+
+def job_cost(steps: int, pixels: int, count: int = 1) -> float:
+    """GPU cost of a job in reference images: steps x pixels x batch size.
+
+    Denoise is deliberately not a factor: ComfyUI's KSampler runs all
+    steps whatever the denoise, it only starts them from a noisier sigma.
+    """
+    return max(MIN_JOB_COST, (steps / REFERENCE_STEPS) * (pixels / REFERENCE_PIXELS) * count)
+
+
+class RateLimitError(Exception):
+    """Raised when a job can't be admitted under the rate limits.
+
+    retry_after is the number of seconds until it could be, or None if it
+    never can because it costs more than a full bucket holds.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Holds up to capacity tokens and refills at rate tokens per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until cost tokens are available; 0 if they are now."""
+        self._refill(now)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float):
+        self.tokens = min(self.capacity, self.tokens - cost)
+
+    def give(self, cost: float):
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+
+class RateLimiter:
+    """Per-user and per-guild token buckets charged with each job's cost.
+
+    A job is admitted only if both its user's and its guild's bucket can
+    pay for it, and then both are charged. A rate of 0 disables that
+    limit. Buckets are created on first use and dropped once they have
+    refilled completely, since a new bucket starts out full anyway.
+    """
+
+    def __init__(
+        self,
+        user_rate: float = 0.0,
+        user_burst: float = 0.0,
+        guild_rate: float = 0.0,
+        guild_burst: float = 0.0
+    ):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.guild_rate = guild_rate
+        self.guild_burst = guild_burst
+        self._users: Dict[Hashable, TokenBucket] = {}
+        self._guilds: Dict[Hashable, TokenBucket] = {}
+        self._last_prune = time.monotonic()
+
+    def charge(self, user_id: Hashable, guild_id: Hashable, cost: float):
+        """Charge a job to its user and guild, or raise RateLimitError without charging anything."""
+        now = time.monotonic()
+        self._prune(now)
+
+        buckets = []
+        if self.user_rate > 0:
+            buckets.append(('You have', self._bucket(self._users, user_id, self.user_rate, self.user_burst)))
+        if self.guild_rate > 0:
+            buckets.append(('This server has', self._bucket(self._guilds, guild_id, self.guild_rate, self.guild_burst)))
+
+        wait, limited = 0.0, None
+        for owner, bucket in buckets:
+            if cost > bucket.capacity:
+                raise RateLimitError(
+                    f"This request costs {cost:.1f} credits, more than the {bucket.capacity:g} "
+                    f"that can be spent at once. Lower the steps, size or image count."
+                )
+            bucket_wait = bucket.wait_time(cost, now)
+            if bucket_wait > wait:
+                wait, limited = bucket_wait, owner
+        if limited is not None:
+            raise RateLimitError(f"{limited} used up the generation budget for now (this request costs {cost:.1f} credits).", wait)
+
+        for _, bucket in buckets:
+            bucket.take(cost)
+
+    def refund(self, user_id: Hashable, guild_id: Hashable, cost: float):
+        """Give back the cost of a job that was charged but never ran."""
+        for buckets, key in ((self._users, user_id), (self._guilds, guild_id)):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.give(cost)
+
+    @staticmethod
+    def _bucket(buckets: Dict[Hashable, TokenBucket], key: Hashable, rate: float, burst: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _prune(self, now: float):
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        for buckets in (self._users, self._guilds):
+            for key in [key for key, bucket in buckets.items() if bucket.wait_time(bucket.capacity, now) == 0]:
+                del buckets[key]
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import uuid
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Tuple, BinaryIO, Union
+
+from image_processing import total_size
+
+logger = logging.getLogger('result_cache')
+
+
+class ResultCache:
+    """Cache of generated images keyed by a hash of the workflow.
+
+    A byte-bounded in-memory LRU sits in front of a byte-bounded on-disk
+    store. Identical requests that are already running share one job
+    instead of queueing duplicates.
+
+    Images go in and come out as file objects; every caller gets its own
+    readers positioned at the start.
+    """
+
+    def __init__(self, directory: str, memory_limit: int, disk_limit: int):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._memory: "OrderedDict[str, List[bytes]]" = OrderedDict()
+        self._memory_size = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_size = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(workflow: Union[Dict[str, Any], str], *extra: str) -> str:
+        """Canonical hash of a workflow (plus anything else the result depends on).
+
+        Rendered template text is hashed as is; it is already canonical for its template.
+        """
+        digest = hashlib.sha256()
+        if not isinstance(workflow, str):
+            workflow = json.dumps(workflow, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        digest.update(workflow.encode())
+        for part in extra:
+            digest.update(b'\0')
+            digest.update(part.encode())
+        return digest.hexdigest()
+
+    async def start(self):
+        """Index what is already on disk, oldest first."""
+        await asyncio.to_thread(self._scan_disk)
+        logger.info(f"Result cache has {len(self._disk)} entries ({self._disk_size} bytes) on disk")
+
+    def _scan_disk(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.tmp-'):
+                shutil.rmtree(path, ignore_errors=True)  # Left over from an interrupted write
+                continue
+            if not os.path.isdir(path):
+                continue
+            files = [os.path.join(path, f) for f in os.listdir(path)]
+            size = sum(os.path.getsize(f) for f in files)
+            entries.append((os.path.getmtime(path), name, size))
+        self._disk.clear()
+        self._disk_size = 0
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+
+    async def get(self, key: str) -> Optional[List[BinaryIO]]:
+        """Return readers for the cached images of a key, or None."""
+        images = self._memory.get(key)
+        if images is not None:
+            self._memory.move_to_end(key)
+            return [io.BytesIO(image) for image in images]
+
+        size = self._disk.get(key)
+        if size is None:
+            return None
+        try:
+            if size <= self.memory_limit:
+                # Small enough to promote into the memory cache
+                images = await asyncio.to_thread(self._read_entry, key)
+                self._remember(key, images)
+                readers = [io.BytesIO(image) for image in images]
+            else:
+                readers = await asyncio.to_thread(self._open_entry, key)
+        except OSError as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            self._forget_disk(key)
+            return None
+        self._disk.move_to_end(key)
+        return readers
+
+    async def put(self, key: str, images: List[BinaryIO]):
+        """Store images under a key in memory and on disk.
+
+        The file objects are rewound afterwards so the caller can still send them.
+        """
+        size = await asyncio.to_thread(total_size, images)
+        if size <= self.memory_limit:
+            self._remember(key, await asyncio.to_thread(_read_all, images))
+        if size > self.disk_limit or key in self._disk:
+            return
+        evicted = []
+        while self._disk and self._disk_size + size > self.disk_limit:
+            old_key, old_size = self._disk.popitem(last=False)
+            self._disk_size -= old_size
+            evicted.append(old_key)
+        self._disk[key] = size
+        self._disk_size += size
+        try:
+            await asyncio.to_thread(self._write_entry, key, images, evicted)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+            self._forget_disk(key)
+
+    async def get_or_create(
+        self,
+        key: str,
+        create: Callable[[], Awaitable[List[BinaryIO]]]
+    ) -> Tuple[List[BinaryIO], bool]:
+        """Return (images, cached). Runs create() only on a miss.
+
+        If the same key is already being created, waits for that job
+        instead of starting another one. If that job fails or is
+        cancelled, the waiter runs create() itself: another user's
+        /cancel or timeout must not fail this request.
+        """
+        while True:
+            images = await self.get(key)
+            if images is not None:
+                return images, True
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            await asyncio.shield(inflight)
+            # Not cached afterwards if it failed or was too large to cache; render our own copy
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            images = await create()
+            if images:
+                await self.put(key, images)
+            return images, False
+        finally:
+            del self._inflight[key]
+            future.set_result(None)
+
+    def _remember(self, key: str, images: List[bytes]):
+        size = sum(len(image) for image in images)
+        if size > self.memory_limit:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = images
+        self._memory_size += size
+        while self._memory_size > self.memory_limit:
+            _, old_images = self._memory.popitem(last=False)
+            self._memory_size -= sum(len(image) for image in old_images)
+
+    def _forget_disk(self, key: str):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_size -= size
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _entry_files(self, key: str) -> List[str]:
+        path = self._entry_path(key)
+        names = sorted(os.listdir(path), key=lambda name: int(name.split('.')[0]))
+        os.utime(path)  # Keep LRU order across restarts
+        return [os.path.join(path, name) for name in names]
+
+    def _read_entry(self, key: str) -> List[bytes]:
+        images = []
+        for file_path in self._entry_files(key):
+            with open(file_path, 'rb') as f:
+                images.append(f.read())
+        return images
+
+    def _open_entry(self, key: str) -> List[BinaryIO]:
+        return [open(file_path, 'rb') for file_path in self._entry_files(key)]
+
+    def _write_entry(self, key: str, images: List[BinaryIO], evicted: List[str]):
+        for old_key in evicted:
+            shutil.rmtree(self._entry_path(old_key), ignore_errors=True)
+
+        # Write into a temporary directory and rename so readers never see partial entries
+        tmp_path = os.path.join(self.directory, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_path)
+        try:
+            for idx, image in enumerate(images):
+                with open(os.path.join(tmp_path, f"{idx}.png"), 'wb') as f:
+                    image.seek(0)
+                    shutil.copyfileobj(image, f)
+                image.seek(0)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+
+def _read_all(images: List[BinaryIO]) -> List[bytes]:
+    data = []
+    for image in images:
+        image.seek(0)
+        data.append(image.read())
+        image.seek(0)
+    return data
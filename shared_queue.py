@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Optional, Dict, Any, List, Iterable, Tuple
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger('shared_queue')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    frontend TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    user_name TEXT NOT NULL,
+    guild_id INTEGER NOT NULL,
+    filesize_limit INTEGER,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, created);
+CREATE TABLE IF NOT EXISTS cancellations (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    frontend TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_frontend ON events(frontend, event_id);
+CREATE TABLE IF NOT EXISTS event_files (
+    event_id INTEGER NOT NULL REFERENCES events(event_id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS event_files_event ON event_files(event_id);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Job states; finished jobs are deleted
+QUEUED = 'queued'
+RUNNING = 'running'
+
+# Event telling a frontend that a job is over and its interaction can be forgotten
+DONE = 'done'
+
+
+class SharedQueue(SQLiteStore):
+    """SQLite queue between Discord frontends and the dispatcher.
+
+    Frontends add jobs and take the events addressed to them; the
+    dispatcher claims jobs, runs them and writes events (messages to send
+    or edit, with their files) back to the frontend that owns the
+    interaction. Any number of processes on one host can open the same
+    file; WAL mode lets readers and the writer work at the same time.
+    """
+
+    schema = SCHEMA
+
+    def _transaction(self, func):
+        with self._lock:
+            with self._db:
+                self._db.execute('BEGIN IMMEDIATE')
+                return func(self._db)
+
+    # Frontend side
+
+    async def submit(
+        self,
+        job_id: str,
+        frontend: str,
+        user_id: int,
+        user_name: str,
+        guild_id: int,
+        filesize_limit: Optional[int],
+        params: Dict[str, Any]
+    ):
+        """Queue a job for the dispatcher. Raises sqlite3.Error if it couldn't be stored."""
+        await asyncio.to_thread(
+            self._execute,
+            'INSERT INTO jobs (job_id, created, frontend, user_id, user_name, guild_id, filesize_limit, params, state) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, time.time(), frontend, user_id, user_name, guild_id, filesize_limit, json.dumps(params), QUEUED)
+        )
+
+    async def request_cancel(self, user_id: int) -> int:
+        """Ask the dispatcher to cancel every job of a user. Returns how many jobs the user has."""
+        def cancel(db: sqlite3.Connection) -> int:
+            count = db.execute('SELECT COUNT(*) FROM jobs WHERE user_id = ?', (user_id,)).fetchone()[0]
+            if count:
+                db.execute('INSERT OR IGNORE INTO cancellations (user_id) VALUES (?)', (user_id,))
+            return count
+        return await asyncio.to_thread(self._transaction, cancel)
+
+    async def take_events(self, frontend: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Remove and return the oldest events for a frontend, each with its files as (filename, data)."""
+        def take(db: sqlite3.Connection) -> List[Dict[str, Any]]:
+            rows = db.execute(
+                'SELECT * FROM events WHERE frontend = ? ORDER BY event_id LIMIT ?', (frontend, limit)
+            ).fetchall()
+            events = []
+            for row in rows:
+                event = dict(row)
+                event['payload'] = json.loads(event['payload'])
+                event['files'] = [
+                    (file['filename'], file['data'])
+                    for file in db.execute(
+                        'SELECT filename, data FROM event_files WHERE event_id = ? ORDER BY rowid', (row['event_id'],)
+                    )
+                ]
+                events.append(event)
+            if rows:
+                db.execute('DELETE FROM events WHERE frontend = ? AND event_id <= ?', (frontend, rows[-1]['event_id']))
+            return events
+        return await asyncio.to_thread(self._transaction, take)
+
+    async def counts(self, user_id: int, guild_id: int) -> Tuple[int, int, int]:
+        """Jobs queued or running: in total, of a user and of a guild."""
+        rows = await asyncio.to_thread(
+            self._execute,
+            'SELECT COUNT(*), COALESCE(SUM(user_id = ?), 0), COALESCE(SUM(guild_id = ?), 0) FROM jobs',
+            (user_id, guild_id)
+        )
+        return tuple(rows[0])
+
+    async def state(self) -> Dict[str, Any]:
+        """What the dispatcher last published: node catalog options, server status and stats."""
+        rows = await asyncio.to_thread(self._execute, 'SELECT name, value FROM state')
+        return {row['name']: json.loads(row['value']) for row in rows}
+
+    # Dispatcher side
+
+    async def claim(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Mark the oldest queued jobs as running and return them."""
+        def claim(db: sqlite3.Connection) -> List[Dict[str, Any]]:
+            rows = db.execute(
+                'SELECT * FROM jobs WHERE state = ? ORDER BY created LIMIT ?', (QUEUED, limit)
+            ).fetchall()
+            db.executemany('UPDATE jobs SET state = ? WHERE job_id = ?', [(RUNNING, row['job_id']) for row in rows])
+            return [self._job(row) for row in rows]
+        return await asyncio.to_thread(self._transaction, claim)
+
+    async def take_cancellations(self) -> List[int]:
+        """Users who asked for their jobs to be cancelled since the last call."""
+        def take(db: sqlite3.Connection) -> List[int]:
+            users = [row['user_id'] for row in db.execute('SELECT user_id FROM cancellations')]
+            db.execute('DELETE FROM cancellations')
+            return users
+        return await asyncio.to_thread(self._transaction, take)
+
+    async def take_interrupted(self) -> List[Dict[str, Any]]:
+        """Remove and return jobs left running by a dispatcher that stopped."""
+        def take(db: sqlite3.Connection) -> List[Dict[str, Any]]:
+            rows = db.execute('SELECT * FROM jobs WHERE state = ? ORDER BY created', (RUNNING,)).fetchall()
+            db.execute('DELETE FROM jobs WHERE state = ?', (RUNNING,))
+            return [self._job(row) for row in rows]
+        return await asyncio.to_thread(self._transaction, take)
+
+    async def emit(
+        self,
+        job: Dict[str, Any],
+        kind: str,
+        payload: Dict[str, Any],
+        files: Iterable[Tuple[str, bytes]] = ()
+    ):
+        """Send an event to the frontend that owns a job. Failures are logged, not raised."""
+        def emit(db: sqlite3.Connection):
+            cursor = db.execute(
+                'INSERT INTO events (frontend, job_id, kind, payload, created) VALUES (?, ?, ?, ?, ?)',
+                (job['frontend'], job['job_id'], kind, json.dumps(payload), time.time())
+            )
+            db.executemany(
+                'INSERT INTO event_files (event_id, filename, data) VALUES (?, ?, ?)',
+                [(cursor.lastrowid, filename, data) for filename, data in files]
+            )
+        try:
+            await asyncio.to_thread(self._transaction, emit)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to send {kind} event for job {job['job_id']}: {e}")
+
+    async def finish(self, job: Dict[str, Any]):
+        """Forget a job and tell its frontend it is over."""
+        await self.emit(job, DONE, {})
+        try:
+            await asyncio.to_thread(self._execute, 'DELETE FROM jobs WHERE job_id = ?', (job['job_id'],))
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to remove job {job['job_id']}: {e}")
+
+    async def publish(self, state: Dict[str, Any]):
+        """Share dispatcher state with the frontends, which have no ComfyUI connection."""
+        await asyncio.to_thread(
+            self._transaction,
+            lambda db: db.executemany(
+                'INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)',
+                [(name, json.dumps(value)) for name, value in state.items()]
+            )
+        )
+
+    async def prune(self, max_age: float):
+        """Drop events nobody collected, e.g. for a frontend that went away."""
+        await asyncio.to_thread(self._execute, 'DELETE FROM events WHERE created < ?', (time.time() - max_age,))
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        return job
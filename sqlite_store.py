@@ -0,0 +1,46 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from typing import Optional, List
+
+
+class SQLiteStore:
+    """Base for the bot's small SQLite databases.
+
+    Subclasses set schema. SQLite calls run in a thread; one connection
+    per process is shared under a lock. The database is in WAL mode, so
+    other processes can read it while one of them writes.
+    """
+
+    schema = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('PRAGMA foreign_keys=ON')
+        # Other processes hold the write lock briefly; wait for it instead of failing
+        self._db.execute('PRAGMA busy_timeout=5000')
+        self._db.executescript(self.schema)
+
+    async def close(self):
+        if self._db is not None:
+            await asyncio.to_thread(self._db.close)
+            self._db = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+from json.encoder import encode_basestring
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger('workflow_templates')
+
+# A slot is a JSON string value that is exactly "{{name}}"
+SLOT_PATTERN = re.compile(r'^\{\{(\w+)\}\}$')
+SERIALIZED_SLOT_PATTERN = re.compile(r'"\{\{(\w+)\}\}"')
+
+# Output node that streams images over the WebSocket instead of saving them
+# (ComfyUI's bundled custom_nodes/websocket_image_save.py)
+WEBSOCKET_OUTPUT_NODE = 'SaveImageWebsocket'
+
+
+def _encode_value(value: Any) -> str:
+    """JSON-encode one slot value, skipping json.dumps overhead for plain scalars."""
+    value_type = type(value)
+    if value_type is str:
+        return encode_basestring(value)
+    if value_type is int:
+        return int.__repr__(value)
+    if value_type is float and math.isfinite(value):
+        return float.__repr__(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+class WorkflowTemplate:
+    """A ComfyUI API-format workflow with named parameter slots.
+
+    Any input whose value is the string "{{name}}" is a slot. The workflow is
+    serialized once at load time and split around its slots, so rendering a
+    request only encodes the parameter values and joins the fragments.
+    """
+
+    def __init__(self, name: str, workflow: Dict[str, Any]):
+        self.name = name
+        self.workflow = workflow
+        self.slots: Dict[str, List[Tuple[str, ...]]] = {}
+        self._find_slots(workflow, ())
+
+        serialized = json.dumps(workflow, separators=(',', ':'), ensure_ascii=False)
+        parts = SERIALIZED_SLOT_PATTERN.split(serialized)
+        self._fragments: List[str] = parts[0::2]
+        self._slot_order: List[str] = parts[1::2]
+        if len(self._slot_order) != sum(len(paths) for paths in self.slots.values()):
+            raise ValueError(f"Workflow template {name} has slots that could not be compiled")
+        self._websocket_variant: Optional[WorkflowTemplate] = None
+
+    @property
+    def output_nodes(self) -> List[str]:
+        """Ids of the nodes that stream their images over the WebSocket."""
+        return [
+            node_id for node_id, node in self.workflow.items()
+            if node.get('class_type') == WEBSOCKET_OUTPUT_NODE
+        ]
+
+    def websocket_output(self) -> 'WorkflowTemplate':
+        """This template with every SaveImage node swapped for SaveImageWebsocket.
+
+        The images then arrive as binary frames on the event socket, without
+        being written to the server's output directory.
+        """
+        if self._websocket_variant is None:
+            workflow = json.loads(json.dumps(self.workflow))
+            for node in workflow.values():
+                if node.get('class_type') == 'SaveImage':
+                    node['class_type'] = WEBSOCKET_OUTPUT_NODE
+                    node['inputs'] = {'images': node['inputs']['images']}
+            self._websocket_variant = WorkflowTemplate(self.name, workflow)
+        return self._websocket_variant
+
+    def _find_slots(self, value: Any, path: Tuple[str, ...]):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                self._find_slots(child, path + (key,))
+        elif isinstance(value, list):
+            for idx, child in enumerate(value):
+                self._find_slots(child, path + (idx,))
+        elif isinstance(value, str):
+            match = SLOT_PATTERN.match(value)
+            if match:
+                self.slots.setdefault(match.group(1), []).append(path)
+
+    def _check_params(self, params: Dict[str, Any]):
+        missing = [name for name in self.slots if name not in params]
+        if missing:
+            raise ValueError(f"Workflow {self.name} is missing parameters: {', '.join(missing)}")
+
+    def render(self, **params) -> str:
+        """Return the filled-in workflow as JSON text, ready to send.
+
+        Parameters without a slot in this template are ignored.
+        """
+        try:
+            values = [_encode_value(params[name]) for name in self._slot_order]
+        except KeyError:
+            self._check_params(params)
+            raise
+        pieces = [self._fragments[0]]
+        for value, fragment in zip(values, self._fragments[1:]):
+            pieces.append(value)
+            pieces.append(fragment)
+        return ''.join(pieces)
+
+
+class WorkflowTemplateRegistry:
+    """Loads every *.json workflow in a directory and reloads changed files."""
+
+    def __init__(self, directory: str, reload_interval: float = 2.0):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._templates: Dict[str, WorkflowTemplate] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._reload_task: Optional[asyncio.Task] = None
+
+    def load(self):
+        """Compile new and changed templates and drop deleted ones."""
+        seen = set()
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.json'):
+                continue
+            name = filename[:-len('.json')]
+            path = os.path.join(self.directory, filename)
+            seen.add(name)
+            mtime = os.path.getmtime(path)
+            if self._mtimes.get(name) == mtime:
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    template = WorkflowTemplate(name, json.load(f))
+            except (OSError, ValueError) as e:
+                # Keep serving the previous version of a template that fails to load
+                logger.error(f"Failed to load workflow template {path}: {e}")
+                continue
+            self._templates[name] = template
+            self._mtimes[name] = mtime
+            logger.info(f"Loaded workflow template {name} with slots: {', '.join(template.slots)}")
+
+        for name in set(self._templates) - seen:
+            del self._templates[name]
+            del self._mtimes[name]
+            logger.info(f"Removed workflow template {name}")
+
+    async def start(self):
+        """Load all templates and start watching the directory for changes."""
+        await asyncio.to_thread(self.load)
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.create_task(self._reload_loop())
+
+    async def close(self):
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            try:
+                await self._reload_task
+            except asyncio.CancelledError:
+                pass
+            self._reload_task = None
+
+    async def _reload_loop(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await asyncio.to_thread(self.load)
+            except Exception as e:
+                logger.error(f"Workflow template reload failed: {e}", exc_info=True)
+
+    def get(self, name: str) -> WorkflowTemplate:
+        template = self._templates.get(name)
+        if template is None:
+            raise KeyError(f"Unknown workflow template: {name}")
+        return template